@@ -12,24 +12,33 @@ import bpy
 from .ui import ImagePackingGroup
 
 classes = []
+handlers = []
 
 ## We load the bulk of our addon should Pillow be present; otherwise, we need only initialize what's present
 ## in the installer.
 try:
     from PIL import Image
     from .ops import RefreshTexturePacker
+    from .ops import PlanTexturePacking
     from .ops import PackTextures
     from .ui import ARC_UL_IPList
     from .ui import FastPackMenu
+    from .texture_packer import track_scene_updates, reset_texture_packer
 
     classes = [
         ImagePackingGroup,
         RefreshTexturePacker,
+        PlanTexturePacking,
         PackTextures,
         ARC_UL_IPList,
         FastPackMenu
     ]
 
+    handlers = [
+        (bpy.app.handlers.depsgraph_update_post, track_scene_updates),
+        (bpy.app.handlers.load_post, reset_texture_packer)
+    ]
+
 except ImportError:
     from .installer_ops import InstallPillow
     from .ui import InstallerMenu
@@ -40,18 +49,40 @@ except ImportError:
         InstallerMenu
     ]
 
+    handlers = []
+
 def register():
     for cls in classes:
         bpy.utils.register_class(cls)
+
+    for (handler_list, handler) in handlers:
+        handler_list.append(handler)
     
     bpy.types.WindowManager.fpack_ui_list = bpy.props.CollectionProperty(type=ImagePackingGroup)
     bpy.types.WindowManager.fpack_ui_list_index = bpy.props.IntProperty(name="FastPack Socket Index", default=0)
     bpy.types.WindowManager.fpack_max_res = bpy.props.IntProperty(name="FastPack Max Res", default=4096)
+    bpy.types.WindowManager.fpack_output_format = bpy.props.EnumProperty(name="Atlas Format", default='PNG', items=[
+        ('PNG', "PNG", "Uncompressed PNG atlases"),
+        ('BC1', "DDS (BC1)", "Block-compressed RGB DDS atlases; alpha is discarded"),
+        ('BC3', "DDS (BC3)", "Block-compressed RGBA DDS atlases"),
+        ('BC7', "DDS (BC7)", "High-quality block-compressed RGBA DDS atlases")
+    ])
+    bpy.types.WindowManager.fpack_generate_mips = bpy.props.BoolProperty(name="Generate Mipmaps", description="Include the full mip chain within DDS atlases", default=False)
+    bpy.types.WindowManager.fpack_merge_materials = bpy.props.BoolProperty(name="Merge Materials", description="Collapse materials left identical by atlasing, removing emptied slots", default=True)
+    bpy.types.WindowManager.fpack_lod_count = bpy.props.IntProperty(name="LOD Levels", description="Number of atlas resolutions to output, each half the size of the last", default=1, min=1, max=8)
 
 def unregister():
     for cls in classes:
         bpy.utils.unregister_class(cls)
+
+    for (handler_list, handler) in handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
     
     del bpy.types.WindowManager.fpack_max_res
+    del bpy.types.WindowManager.fpack_output_format
+    del bpy.types.WindowManager.fpack_generate_mips
+    del bpy.types.WindowManager.fpack_lod_count
+    del bpy.types.WindowManager.fpack_merge_materials
     del bpy.types.WindowManager.fpack_ui_list
     del bpy.types.WindowManager.fpack_ui_list_index
\ No newline at end of file
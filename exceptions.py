@@ -1,2 +1,5 @@
 class PackingException(Exception):
-    """Thrown when there is insufficient room to pack a UV region."""
\ No newline at end of file
+    """Thrown when there is insufficient room to pack a UV region."""
+
+class ImageLoadException(Exception):
+    """Thrown when the pixel data of an image to be packed cannot be retrieved."""
\ No newline at end of file
@@ -1,5 +1,7 @@
 from ..texture_packer import TexturePacker
+from ..exceptions import ImageLoadException
 from ..utils.image_packing import get_file_name
+from ..utils.planning import update_layout_preview
 import bpy
 
 class RefreshTexturePacker(bpy.types.Operator):
@@ -11,9 +13,44 @@ class RefreshTexturePacker(bpy.types.Operator):
     # Note: We store our resulting object in bpy.types.Scene.fpack_state .
     def execute(self, context):
         # TODO: Provide means to exclude nodes from blacklist.
-        context.window_manager.fpack_ui_list.clear() # Clear out any leftover data.
-        bpy.types.WindowManager.fpack_state = TexturePacker([obj for obj in bpy.context.selected_objects if obj.type == "MESH"], {'ShaderNodeBsdfTransparent'})
+        objs = [obj for obj in bpy.context.selected_objects if obj.type == "MESH"]
 
+        # Loops can only be remapped onto an atlas through an active UV map.
+        skipped = [obj.name for obj in objs if obj.data.uv_layers.active == None]
+        objs = [obj for obj in objs if obj.data.uv_layers.active != None]
+        if len(skipped) > 0:
+            self.report({'WARNING'}, f'Skipped meshes without a UV map: {", ".join(skipped)}')
+
+        state = getattr(bpy.types.WindowManager, 'fpack_state', None)
+        bpy.types.WindowManager.fpack_plan = None
+
+        # Prior analysis is reused where possible; only new or modified objects and materials are re-analysed.
+        if state == None:
+            bpy.types.WindowManager.fpack_state = TexturePacker(objs, {'ShaderNodeBsdfTransparent'})
+        else:
+            state.refresh(objs)
+
+        return {'FINISHED'}
+
+class PlanTexturePacking(bpy.types.Operator):
+    """Predicts atlas layouts, memory use and bake time without baking"""
+
+    bl_idname = "arcfpack.plan_texture_packing"
+    bl_label = "Plan texture packing"
+
+    @classmethod
+    def poll(cls, context):
+        return getattr(bpy.types.WindowManager, 'fpack_state', None) != None
+
+    # Note: We store our resulting plan in bpy.types.WindowManager.fpack_plan .
+    def execute(self, context):
+        wm = context.window_manager
+        plan = wm.fpack_state.plan(wm.fpack_max_res, wm.fpack_output_format, wm.fpack_generate_mips, wm.fpack_lod_count)
+
+        bpy.types.WindowManager.fpack_plan = plan
+        bpy.types.WindowManager.fpack_plan_preview = update_layout_preview(plan).name if plan.success else None
+
+        self.report({'INFO'} if plan.success else {'WARNING'}, plan.message)
         return {'FINISHED'}
 
 class PackTextures(bpy.types.Operator):
@@ -22,14 +59,24 @@ class PackTextures(bpy.types.Operator):
     bl_idname = "arcfpack.pack_textures"
     bl_label = "Pack textures"
 
+    @classmethod
+    def poll(cls, context):
+        return getattr(bpy.types.WindowManager, 'fpack_state', None) != None
+
     def execute(self, context):
         # As the operations undertaken are mutable, we split off into a new file.
         #original_file = f'{bpy.path.abspath("//")}/{bpy.path.basename(bpy.data.filepath)}'
         bpy.ops.wm.save_as_mainfile(filepath=f'{bpy.path.abspath("//")}/{get_file_name()}_baked.blend')
 
-        if not context.window_manager.fpack_state.build(context.window_manager.fpack_max_res):
-            #bpy.ops.wm.open_mainfile(filepath=original_file)
-            pass
+        wm = context.window_manager
+        try:
+            if not wm.fpack_state.build(wm.fpack_max_res, wm.fpack_output_format, wm.fpack_generate_mips, wm.fpack_lod_count, wm.fpack_merge_materials):
+                #bpy.ops.wm.open_mainfile(filepath=original_file)
+                pass
+        except ImageLoadException as e:
+            # Images are decoded before the scene is modified; the baked file is hence left as saved.
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
         
         bpy.ops.wm.save_mainfile()
         return {'FINISHED'}
\ No newline at end of file
@@ -1,10 +1,33 @@
 from collections import defaultdict
-from functools import reduce
 from .utils.shader_graph import grab_socket_image_nodes
-from .utils.image_retrieval import ImagePackData, load_image, retrieve_images_and_uvs, load_atlases, replace_images
-from .utils.image_packing import calculate_uv_ratios, size_group_images, pack_uvs, pack_images
+from .utils.image_retrieval import AnalysisCache, ImagePackData, load_image, retrieve_images_and_uvs, load_atlases, replace_images, bind_palette_cells, configure_palettes, size_palettes
+from .utils.image_packing import calculate_uv_ratios, layout_resolution, size_group_images, apply_uv_layout, pack_images
+from .utils.planning import BakePlan, plan_bake
+from .utils.material_merging import merge_materials
+from bpy.app.handlers import persistent
 import bpy
 
+@persistent
+def track_scene_updates(scene, depsgraph):
+    """Forwards depsgraph updates to the active TexturePacker's analysis cache, such that refreshes re-analyse modified datablocks."""
+
+    state = getattr(bpy.types.WindowManager, 'fpack_state', None)
+    if state != None:
+        state.analysis.mark_updates(depsgraph.updates)
+
+@persistent
+def reset_texture_packer(*args):
+    """Drops the active TexturePacker and plan upon loading a file, as both reference datablocks of the file unloaded.
+    The UI list is saved alongside the file (e.g. within every baked file), and is hence cleared to match.
+    """
+
+    bpy.types.WindowManager.fpack_state = None
+    bpy.types.WindowManager.fpack_plan = None
+    bpy.types.WindowManager.fpack_plan_preview = None
+
+    if bpy.context.window_manager != None:
+        bpy.context.window_manager.fpack_ui_list.clear()
+
 def denormalized(x: float):
     if x > 1.0 or x < 0.0:
         return True
@@ -17,9 +40,17 @@ class TexturePacker:
     """Manages the state of an unpacked selection of UVs."""
 
     def __init__(self, objs: list[bpy.types.Object], node_blacklist: set[bpy.types.Node]):
-        self.objs = objs
         self.blacklist= node_blacklist
-        (self.image_packs, self.uvs) = retrieve_images_and_uvs(objs, node_blacklist)
+        self.analysis = AnalysisCache(node_blacklist)
+        self.refresh(objs)
+
+    def refresh(self, objs: list[bpy.types.Object]):
+        """Re-analyses the given selection, reusing the cached analysis of unchanged objects and materials, and
+        retaining the group assignments of sockets already present in the UI list.
+        """
+
+        self.objs = objs
+        (self.image_packs, self.uvs) = retrieve_images_and_uvs(objs, self.blacklist, self.analysis)
 
         # Initial sorting of image_packs ought to be by material input.
         self.socket_images = {}
@@ -31,39 +62,96 @@ class TexturePacker:
             
             self.socket_images[socket].append(im_pack_data)
 
-        # We generate our UIList components--surmising each shader input a separate pack.
-        self.ui_list = bpy.context.window_manager.fpack_ui_list
-        for i, socket in enumerate(self.socket_images.keys()):
-            ui_group = self.ui_list.add()
-            ui_group.socket = socket
-            ui_group.target_group = i
+        # We generate our UIList components--surmising each newly-discovered shader input a separate pack.
+        # The list is fetched anew each time, as the window manager it belongs to is replaced whenever a file is loaded.
+        ui_list = bpy.context.window_manager.fpack_ui_list
+        assigned_groups = {ui_group.socket : ui_group.target_group for ui_group in ui_list}
+        next_group = max(assigned_groups.values(), default=-1) + 1
 
-    def build(self, max_res):
-        """Constructs all requisite atlas textures and UVs. Returns True on success, False on failure."""
-        (uv_reference_surface_areas, uv_widths_normalized, uv_heights_normalized) = calculate_uv_ratios(self.image_packs, self.uvs, max_res)
-        if reduce(lambda a, b: a + b, uv_reference_surface_areas, 0) > max_res**2:
-            return False 
+        # Sockets driven solely by palette cells would otherwise fill a full atlas with a handful of cells; they instead
+        # default to sharing a group with images, provided that group holds no other palette grid to overlap theirs.
+        has_palette = {socket : any(pack.cells != None for pack in packs) for socket, packs in self.socket_images.items()}
+        palette_only = {socket for socket, packs in self.socket_images.items() if all(pack.cells != None for pack in packs)}
 
-        for image in self.image_packs:
-            self.image_packs[image].load_image()
+        socket_groups = {}
+        for socket in sorted(self.socket_images.keys(), key=lambda socket: socket in palette_only):
+            if socket in assigned_groups:
+                socket_groups[socket] = assigned_groups[socket]
+                continue
+
+            if socket in palette_only:
+                hosts = [group for group in sorted(set(socket_groups.values()))
+                    if not any(has_palette[other] for other, other_group in socket_groups.items() if other_group == group)]
+
+                if len(hosts) > 0:
+                    socket_groups[socket] = hosts[0]
+                    continue
+
+            socket_groups[socket] = next_group
+            next_group += 1
+
+        ui_list.clear()
+        for socket in self.socket_images.keys():
+            ui_group = ui_list.add()
+            ui_group.socket = socket
+            ui_group.target_group = socket_groups[socket]
+
+    def group_image_packs(self) -> defaultdict[int, list[ImagePackData]]:
+        """Collects the image_packs of each target group, as configured within the UI list."""
 
         # It's necessary to fetch the image_packs associated with each group by UV to ensure proportionality.
         group_images: defaultdict[int, list[ImagePackData]] = defaultdict(lambda: []) # We leverage a dictionary, as groups may be non-contiguous due to limitations in Blender's property system.
 
-        for config in self.ui_list:
+        for config in bpy.context.window_manager.fpack_ui_list:
             for image_pack in self.socket_images[config.socket]:
                 group_images[config.target_group].append(image_pack)
-        
+
+        configure_palettes(group_images)
+        return group_images
+
+    def plan(self, max_res, output_format='PNG', generate_mips=False, lod_count=1) -> BakePlan:
+        """Predicts the outcome of build from metadata alone, decoding no images and leaving the scene untouched."""
+
+        size_palettes(self.image_packs, lod_count)
+        max_res = layout_resolution(self.image_packs, max_res)
+        return plan_bake(self.image_packs, self.group_image_packs(), self.uvs, max_res, output_format, generate_mips, lod_count)
+
+    def build(self, max_res, output_format='PNG', generate_mips=False, lod_count=1, merge=True):
+        """Constructs all requisite atlas textures and UVs. Returns True on success, False on failure.
+
+        Atlases are written as PNGs, or as block-compressed DDS files should output_format name a BC format;
+        lod_count levels of each are written from the one layout, the first of which is bound to the materials.
+        Should merge be set, materials left identical by the bake are thereafter collapsed into one.
+        """
+
+        # The layout is settled before any image is decoded, such that failing bakes fail early.
+        size_palettes(self.image_packs, lod_count)
+        max_res = layout_resolution(self.image_packs, max_res)
+        plan = self.plan(max_res, output_format, generate_mips, lod_count)
+        if not plan.success:
+            return False
+
+        (uv_reference_surface_areas, _, _) = calculate_uv_ratios(self.image_packs, self.uvs, max_res)
+
+        # Grouping precedes loading, as palette grids are encoded to match the atlas they're packed into.
+        group_images = self.group_image_packs()
+
+        # Packs sharing a source (e.g. an untiled image pasted into several UDIM tiles) share its decoded data.
+        decoded = {}
+        for image in self.image_packs:
+            self.image_packs[image].load_image(decoded)
+
         # Resize our images as appropriate, saving the scaling information such that we may detect
         # relative maximum sizes of our atlases.
         group_scales = size_group_images(group_images, uv_reference_surface_areas)
+        apply_uv_layout(self.uvs, plan.rects)
 
-        try:
-            uv_transforms = pack_uvs(self.uvs, uv_widths_normalized, uv_heights_normalized)
-        except:
-            return False
+        atlas_paths = pack_images(group_images, group_scales, plan.rects, max_res, output_format, generate_mips, lod_count)
+        atlases = load_atlases(atlas_paths)
+        replace_images(self.objs, self.blacklist, group_images, atlases)
+        bind_palette_cells(self.blacklist, group_images, atlases)
 
-        pack_images(group_images, group_scales, uv_transforms, max_res)
-        replace_images(self.objs, self.blacklist, group_images, load_atlases(group_images.keys()))
+        if merge:
+            merge_materials(self.objs)
 
-        return True
\ No newline at end of file
+        return True
@@ -36,7 +36,44 @@ class FastPackMenu(bpy.types.Panel):
             row = layout.row()
             col = layout.column(align=True)
             row.prop(wm, "fpack_max_res")
+
+            row = layout.row()
+            row.prop(wm, "fpack_output_format")
+
+            if wm.fpack_output_format != 'PNG':
+                row = layout.row()
+                row.prop(wm, "fpack_generate_mips")
+
+            row = layout.row()
+            row.prop(wm, "fpack_lod_count")
+
+            row = layout.row()
+            row.prop(wm, "fpack_merge_materials")
+
+            row = layout.row()
+            row.operator("arcfpack.plan_texture_packing", text="Plan Bake", icon="VIEWZOOM")
+
+            # Should a dry run have been planned, we summarize its predictions.
+            plan = getattr(wm, "fpack_plan", None)
+            if plan != None:
+                self.draw_plan(layout, wm, plan)
             
             row = layout.row()
             col = layout.column(align=True)
             row.operator("arcfpack.pack_textures", text="Pack Textures", icon="OUTPUT")
+
+    def draw_plan(self, layout, wm, plan):
+        box = layout.box()
+        box.label(text=plan.message, icon="INFO" if plan.success else "ERROR")
+
+        for group in plan.groups:
+            col = box.column(align=True)
+            col.label(text=f"Group {group.group}: {group.resolution}px, {group.channels} channel(s)")
+            col.label(text=f"Fill {group.fill_ratio:.0%} | {group.memory / 2**20:.0f} MiB | ~{group.seconds:.1f}s")
+
+            if group.palette_only:
+                col.label(text="Palette cells only; consider a group shared with images", icon="ERROR")
+
+        preview = bpy.data.images.get(getattr(wm, "fpack_plan_preview", None) or "")
+        if preview != None and preview.preview != None:
+            box.template_icon(icon_value=preview.preview.icon_id, scale=8.0)
\ No newline at end of file
@@ -0,0 +1,319 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+import numpy as np
+
+## Block-compressed formats supported for atlas output, mapped to their compressed block size in bytes.
+BLOCK_SIZES = {
+    'BC1': 8,
+    'BC3': 16,
+    'BC7': 16
+}
+
+## Number of 4x4 block rows handed to each worker; NumPy releases the GIL over the bulk of the
+## encoding arithmetic, so strips of this height encode concurrently across threads.
+TILE_BLOCK_ROWS = 32
+
+## Number of blocks encoded at once within a strip, bounding each worker's working set irrespective of atlas width.
+CHUNK_BLOCKS = 4096
+
+## Number of strips encoded concurrently; each holds a working set of its own, so we don't scale with core count alone.
+ENCODE_WORKERS = min(4, os.cpu_count() or 1)
+
+## Rough upper bound on the bytes held per block while a chunk is encoded: its float pixels, palette, and index buffers.
+ENCODE_BLOCK_BYTES = 1024
+
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PIXELFORMAT = 0x1000
+DDSD_MIPMAPCOUNT = 0x20000
+DDSD_LINEARSIZE = 0x80000
+DDPF_FOURCC = 0x4
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+DXGI_FORMAT_BC7_UNORM = 98
+D3D10_RESOURCE_DIMENSION_TEXTURE2D = 3
+
+BC7_WEIGHTS = np.array([0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64], dtype=np.int32)
+
+def halve_axis(data: np.ndarray, axis: int) -> np.ndarray:
+    """Reduces a float image to max(1, n >> 1) texels along an axis. Each output texel box-filters the span of
+    n / (n >> 1) source texels it covers, such that odd-sized inputs fold their extra row or column evenly
+    into their neighbours rather than being dropped or replicated.
+    """
+
+    size = data.shape[axis]
+    if size == 1:
+        return data
+
+    if size % 2 == 0:
+        return (data.take(np.arange(0, size, 2), axis) + data.take(np.arange(1, size, 2), axis)) * 0.5
+
+    target = size >> 1
+    span = size / target
+    starts = np.arange(target) * span
+    ends = starts + span
+    first = np.floor(starts).astype(np.int64)
+
+    # Spans are narrower than three texels, and hence overlap at most four.
+    shape = [1] * data.ndim
+    shape[axis] = target
+    result = np.zeros(data.shape[:axis] + (target,) + data.shape[axis + 1:], dtype=np.float32)
+    for offset in range(4):
+        texels = first + offset
+        coverage = np.clip(np.minimum(ends, texels + 1) - np.maximum(starts, texels), 0.0, None) / span
+        result += data.take(np.minimum(texels, size - 1), axis) * coverage.astype(np.float32).reshape(shape)
+
+    return result
+
+def downsample_half(image_data: np.ndarray, has_alpha: bool = False) -> np.ndarray:
+    """Halves an (h, w, c) image along each axis to max(1, n >> 1) texels via a box filter, folding the final
+    row or column of odd-sized inputs into its neighbours. Should the final channel be alpha, color is filtered
+    premultiplied so that transparent texels do not bleed into their neighbours.
+    """
+
+    data = image_data.astype(np.float32)
+
+    if has_alpha:
+        data[:, :, 0:-1] *= data[:, :, -1:]
+
+    data = halve_axis(halve_axis(data, 0), 1)
+
+    if has_alpha:
+        alpha = data[:, :, -1:]
+        data[:, :, 0:-1] = np.divide(data[:, :, 0:-1], alpha, out=np.zeros_like(data[:, :, 0:-1]), where=alpha > 0)
+
+    if np.issubdtype(image_data.dtype, np.integer):
+        return np.rint(data).astype(image_data.dtype)
+
+    return data.astype(image_data.dtype)
+
+def mip_chain(image_data: np.ndarray) -> list[np.ndarray]:
+    """Generates the full mip chain of an RGBA image, down to and including its 1x1 level; floor(log2(max(w, h))) + 1
+    levels in all.
+    """
+
+    levels = [image_data]
+
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        levels.append(downsample_half(levels[-1], has_alpha=True))
+
+    return levels
+
+def split_blocks(image_data: np.ndarray) -> np.ndarray:
+    """Splits an (h, w, 4) uint8 image into an (n, 16, 4) array of row-major 4x4 blocks, padding partial
+    blocks by edge replication.
+    """
+
+    (height, width) = image_data.shape[0:2]
+    pad_y = (4 - height % 4) % 4
+    pad_x = (4 - width % 4) % 4
+
+    if pad_y or pad_x:
+        image_data = np.pad(image_data, ((0, pad_y), (0, pad_x), (0, 0)), mode='edge')
+
+    (blocks_y, blocks_x) = (image_data.shape[0] // 4, image_data.shape[1] // 4)
+    blocks = image_data.reshape(blocks_y, 4, blocks_x, 4, 4).transpose(0, 2, 1, 3, 4)
+
+    return blocks.reshape(blocks_y * blocks_x, 16, 4)
+
+def pack_bits(fields: list[tuple[np.ndarray, int]], block_size: int) -> np.ndarray:
+    """Packs per-block bit fields, given LSB-first as (values, bit width) pairs, into an (n, block_size) byte array."""
+
+    res = np.zeros((len(fields[0][0]), block_size), dtype=np.uint8)
+    offset = 0
+
+    for (values, width) in fields:
+        values = values.astype(np.uint64)
+
+        for bit in range(width):
+            res[:, offset // 8] |= ((values >> np.uint64(bit)) & np.uint64(1)).astype(np.uint8) << np.uint8(offset % 8)
+            offset += 1
+
+    return res
+
+def nearest_indices(pixels: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Given (n, 16, c) pixels and an (n, k, c) palette, returns the (n, 16) index of each pixel's nearest entry.
+    Entries are compared one at a time, such that no (n, 16, k, c) distance tensor need be held.
+    """
+
+    best = np.full(pixels.shape[0:2], np.inf, dtype=np.float32)
+    res = np.zeros(pixels.shape[0:2], dtype=np.int64)
+
+    for entry in range(palette.shape[1]):
+        distances = ((pixels - palette[:, entry:entry + 1, :])**2).sum(axis=2)
+        closer = distances < best
+        best = np.where(closer, distances, best)
+        res[closer] = entry
+
+    return res
+
+def encode_rgb565(colors: np.ndarray) -> np.ndarray:
+    r = np.rint(colors[:, 0] * (31 / 255)).astype(np.uint32)
+    g = np.rint(colors[:, 1] * (63 / 255)).astype(np.uint32)
+    b = np.rint(colors[:, 2] * (31 / 255)).astype(np.uint32)
+
+    return (r << 11) | (g << 5) | b
+
+def decode_rgb565(packed: np.ndarray) -> np.ndarray:
+    r = (packed >> 11) & 31
+    g = (packed >> 5) & 63
+    b = packed & 31
+
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=1).astype(np.float32)
+
+def encode_color_blocks(blocks: np.ndarray) -> np.ndarray:
+    """Encodes the RGB components of (n, 16, 4) blocks as four-color BC1 blocks."""
+
+    pixels = blocks[:, :, 0:3].astype(np.float32)
+
+    # We inset the bounding box of each block's colors slightly, which lowers the error of the interpolants.
+    low = pixels.min(axis=1)
+    high = pixels.max(axis=1)
+    inset = (high - low) / 16
+    c0 = encode_rgb565(np.clip(high - inset, 0, 255))
+    c1 = encode_rgb565(np.clip(low + inset, 0, 255))
+
+    # Four-color mode requires c0 > c1; should the ordering be inverted we swap the endpoints, whereas
+    # degenerate blocks decode as a single color regardless of their indices.
+    swap = c0 < c1
+    (c0, c1) = (np.where(swap, c1, c0), np.where(swap, c0, c1))
+
+    e0 = decode_rgb565(c0)
+    e1 = decode_rgb565(c1)
+    palette = np.stack((e0, e1, (2 * e0 + e1) / 3, (e0 + 2 * e1) / 3), axis=1)
+
+    indices = nearest_indices(pixels, palette)
+    indices[c0 == c1] = 0
+
+    fields = [(c0, 16), (c1, 16)] + [(indices[:, i], 2) for i in range(16)]
+    return pack_bits(fields, 8)
+
+def encode_alpha_blocks(blocks: np.ndarray) -> np.ndarray:
+    """Encodes the alpha components of (n, 16, 4) blocks as eight-value BC3 alpha blocks."""
+
+    alpha = blocks[:, :, 3:4].astype(np.float32)
+    a0 = alpha.max(axis=1)[:, 0]
+    a1 = alpha.min(axis=1)[:, 0]
+
+    steps = np.arange(1, 7, dtype=np.float32)
+    interpolants = ((7 - steps) * a0[:, np.newaxis] + steps * a1[:, np.newaxis]) / 7
+    palette = np.concatenate((a0[:, np.newaxis], a1[:, np.newaxis], interpolants), axis=1)[:, :, np.newaxis]
+
+    indices = nearest_indices(alpha, palette)
+    indices[a0 == a1] = 0
+
+    fields = [(a0.astype(np.uint8), 8), (a1.astype(np.uint8), 8)] + [(indices[:, i], 3) for i in range(16)]
+    return pack_bits(fields, 8)
+
+def encode_bc7_blocks(blocks: np.ndarray) -> np.ndarray:
+    """Encodes (n, 16, 4) blocks as BC7 mode 6 blocks; a single RGBA endpoint pair with 4-bit indices."""
+
+    pixels = blocks.astype(np.float32)
+    endpoints = np.stack((pixels.max(axis=1), pixels.min(axis=1)), axis=1)
+
+    # Each endpoint shares its least-significant bit across all four channels; we quantize the remaining seven
+    # bits against either choice, keeping whichever reconstructs the endpoint more closely. Fully opaque and fully
+    # transparent endpoints are held to the bit reproducing their alpha exactly, lest solid texels turn translucent.
+    candidates = []
+    for p_bit in (0, 1):
+        quantized = np.clip(np.rint((endpoints - p_bit) / 2), 0, 127).astype(np.int32)
+        error = ((((quantized << 1) | p_bit) - endpoints)**2).sum(axis=2)
+        candidates.append((quantized, error))
+
+    alpha = endpoints[:, :, 3]
+    p_bits = np.where(alpha >= 255, True, np.where(alpha <= 0, False, candidates[1][1] < candidates[0][1]))
+    quantized = np.where(p_bits[:, :, np.newaxis], candidates[1][0], candidates[0][0])
+    expanded = (quantized << 1) | p_bits[:, :, np.newaxis]
+
+    weights = BC7_WEIGHTS[np.newaxis, :, np.newaxis]
+    palette = (((64 - weights) * expanded[:, 0:1, :] + weights * expanded[:, 1:2, :] + 32) >> 6).astype(np.float32)
+    indices = nearest_indices(pixels, palette)
+
+    # The anchor index's most-significant bit is implicit, and must hence be zero; blocks violating this
+    # have their endpoints swapped and indices inverted.
+    swap = indices[:, 0] >= 8
+    quantized[swap] = quantized[swap][:, ::-1, :]
+    p_bits[swap] = p_bits[swap][:, ::-1]
+    indices[swap] = 15 - indices[swap]
+
+    mode = np.full(len(blocks), 1 << 6)
+    fields = [(mode, 7)]
+    fields += [(quantized[:, endpoint, channel], 7) for channel in range(4) for endpoint in range(2)]
+    fields += [(p_bits[:, 0], 1), (p_bits[:, 1], 1), (indices[:, 0], 3)]
+    fields += [(indices[:, i], 4) for i in range(1, 16)]
+
+    return pack_bits(fields, 16)
+
+def encode_blocks(blocks: np.ndarray, compression: str) -> np.ndarray:
+    if compression == 'BC1':
+        return encode_color_blocks(blocks)
+
+    if compression == 'BC3':
+        return np.concatenate((encode_alpha_blocks(blocks), encode_color_blocks(blocks)), axis=1)
+
+    if compression == 'BC7':
+        return encode_bc7_blocks(blocks)
+
+    raise ValueError(f'Unsupported block compression: {compression}')
+
+def encode_strip(strip: np.ndarray, compression: str) -> bytes:
+    """Block-compresses a strip of block rows, CHUNK_BLOCKS blocks at a time."""
+
+    blocks = split_blocks(strip)
+    return b''.join(encode_blocks(blocks[i:i + CHUNK_BLOCKS], compression).tobytes() for i in range(0, len(blocks), CHUNK_BLOCKS))
+
+def encode_working_set(width: int) -> int:
+    """Predicts the bytes held by the workers concurrently encoding strips of a width-wide image."""
+
+    strip_blocks = TILE_BLOCK_ROWS * max(1, (width + 3) // 4)
+    return ENCODE_WORKERS * (strip_blocks * 64 + min(strip_blocks, CHUNK_BLOCKS) * ENCODE_BLOCK_BYTES)
+
+def encode_image(image_data: np.ndarray, compression: str) -> bytes:
+    """Block-compresses an (h, w, 4) uint8 image, encoding strips of block rows in parallel."""
+
+    (height, width) = image_data.shape[0:2]
+    strip_height = TILE_BLOCK_ROWS * 4
+    strips = [image_data[y:y + strip_height] for y in range(0, height, strip_height)]
+
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as executor:
+        encoded = executor.map(lambda strip: encode_strip(strip, compression), strips)
+
+        return b''.join(encoded)
+
+def dds_header(width: int, height: int, mip_count: int, compression: str) -> bytes:
+    """Builds the DDS magic and header (plus its DX10 extension for BC7) for a block-compressed texture."""
+
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
+    caps = DDSCAPS_TEXTURE
+
+    if mip_count > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+
+    linear_size = max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_SIZES[compression]
+    four_cc = {'BC1': b'DXT1', 'BC3': b'DXT5', 'BC7': b'DX10'}[compression]
+
+    pixel_format = struct.pack('<II4s5I', 32, DDPF_FOURCC, four_cc, 0, 0, 0, 0, 0)
+    header = struct.pack('<7I44x', 124, flags, height, width, linear_size, 0, mip_count)
+    header += pixel_format + struct.pack('<5I', caps, 0, 0, 0, 0)
+
+    res = b'DDS ' + header
+    if compression == 'BC7':
+        res += struct.pack('<5I', DXGI_FORMAT_BC7_UNORM, D3D10_RESOURCE_DIMENSION_TEXTURE2D, 0, 1, 0)
+
+    return res
+
+def save_dds(image_data: np.ndarray, path: str, compression: str, generate_mips: bool = False):
+    """Writes a top-down (h, w, 4) uint8 image to a block-compressed DDS file, optionally alongside its full mip chain."""
+
+    levels = mip_chain(image_data) if generate_mips else [image_data]
+    (height, width) = image_data.shape[0:2]
+
+    with open(path, 'wb') as file:
+        file.write(dds_header(width, height, len(levels), compression))
+
+        for level in levels:
+            file.write(encode_image(level, compression))
@@ -1,12 +1,15 @@
 from collections import defaultdict
 from dataclasses import dataclass
-from .image_retrieval import ImagePackData
+from .image_retrieval import ImagePackData, color_channel_count, srgb_to_linear
 from .image_retrieval import UVReference
+from .dds_encoding import downsample_half, save_dds
 from ..exceptions import PackingException
 from PIL import Image
 
 import math
 import re
+import struct
+import zlib
 import numpy as np
 import bpy
 
@@ -22,7 +25,7 @@ class UVRectangle:
     height: float
 
     def could_overlap(self, x, y, rect: 'UVRectangle') -> bool:
-        if rect.x == None:
+        if rect.x == None or rect_area(rect) == 0:
             return False
         
         x2 = x + self.width
@@ -60,6 +63,99 @@ def resize_algorithm(image_pack: ImagePackData) -> int:
     ##    case _:
     return Image.LINEAR
 
+## PIL modes for 8-bit data, by channel count.
+PIL_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+
+## PNG color types, by channel count.
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+def channel_layout(channels: int) -> tuple[bool, bool]:
+    """Returns whether image data of a given channel count carries color and alpha, respectively."""
+
+    return (channels >= 3, channels % 2 == 0)
+
+def group_mode(group: list[ImagePackData]) -> tuple[int, np.dtype]:
+    """Determines the narrowest channel count and precision able to represent every image in a group."""
+
+    (has_color, has_alpha) = (False, False)
+    dtype = np.dtype(np.uint8)
+
+    for pack in group:
+        (color, alpha) = channel_layout(pack.image.shape[2])
+        has_color = has_color or color
+        has_alpha = has_alpha or alpha
+        dtype = np.promote_types(dtype, pack.image.dtype)
+
+    return ((3 if has_color else 1) + (1 if has_alpha else 0), dtype)
+
+def convert_depth(image_data: np.ndarray, dtype: np.dtype, srgb: bool = False) -> np.ndarray:
+    """Converts pixel data between precisions, rescaling integer ranges as necessary. Should srgb be set, integer
+    color data is sRGB-encoded, and is linearized on promotion to float; float data is always linear.
+    """
+
+    if image_data.dtype == dtype:
+        return image_data
+
+    normalized = image_data.astype(np.float32)
+    if np.issubdtype(image_data.dtype, np.integer):
+        normalized /= np.iinfo(image_data.dtype).max
+
+    if not np.issubdtype(dtype, np.integer):
+        if srgb and np.issubdtype(image_data.dtype, np.integer):
+            color_channels = color_channel_count(normalized.shape[2])
+            normalized[:, :, 0:color_channels] = srgb_to_linear(normalized[:, :, 0:color_channels])
+
+        return normalized.astype(dtype)
+
+    return np.rint(np.clip(normalized, 0.0, 1.0) * np.iinfo(dtype).max).astype(dtype)
+
+def conform_image(image_data: np.ndarray, channels: int, dtype: np.dtype, srgb: bool = False) -> np.ndarray:
+    """Expands pixel data to a given channel count and precision; grayscale is replicated, and missing alpha made opaque.
+    Should srgb be set, integer color data is linearized on promotion to float (see convert_depth).
+    """
+
+    image_data = convert_depth(image_data, dtype, srgb)
+    (src_color, src_alpha) = channel_layout(image_data.shape[2])
+    (has_color, has_alpha) = channel_layout(channels)
+
+    if (src_color, src_alpha) == (has_color, has_alpha):
+        return image_data
+
+    color = image_data[:, :, 0:(3 if src_color else 1)]
+    if has_color and not src_color:
+        color = np.repeat(color, 3, axis=2)
+
+    if not has_alpha:
+        return color
+
+    if src_alpha:
+        alpha = image_data[:, :, -1:]
+    else:
+        opaque = np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else 1.0
+        alpha = np.full(image_data.shape[0:2] + (1,), opaque, dtype=dtype)
+
+    return np.concatenate((color, alpha), axis=2)
+
+def resize_image(image_data: np.ndarray, size: tuple[int, int], algorithm: int) -> np.ndarray:
+    """Resizes pixel data to a given (width, height), retaining its channel count and precision."""
+
+    (width, height) = size
+    if image_data.shape[0:2] == (height, width):
+        return image_data
+
+    if image_data.dtype == np.uint8:
+        image = Image.fromarray(image_data[:, :, 0] if image_data.shape[2] == 1 else image_data, PIL_MODES[image_data.shape[2]])
+        return np.asarray(image.resize(size, algorithm)).reshape((height, width, image_data.shape[2]))
+
+    # PIL lacks multi-channel modes beyond 8 bits per channel; we therefore resample each channel as a float image.
+    channels = [np.asarray(Image.fromarray(image_data[:, :, i].astype(np.float32), 'F').resize(size, algorithm)) for i in range(image_data.shape[2])]
+    resized = np.stack(channels, axis=2)
+
+    if np.issubdtype(image_data.dtype, np.integer):
+        return np.rint(np.clip(resized, 0, np.iinfo(image_data.dtype).max)).astype(image_data.dtype)
+
+    return resized.astype(image_data.dtype)
+
 def calculate_uv_ratios(images: dict[bpy.types.Image, ImagePackData], uvs: list[list[UVReference]], max_res: int):
     # We must calculate the maximum percentage surface area occupied by our images per UV. This is to be a barometer for what must be resized.
     uv_max_surface_areas = [0] * len(uvs)
@@ -67,7 +163,7 @@ def calculate_uv_ratios(images: dict[bpy.types.Image, ImagePackData], uvs: list[
     uv_max_surface_heights = [0] * len(uvs)
 
     for image_pack in images.values():
-        (w, h) = image_pack.bl_image.size
+        (w, h) = image_pack.size
         area = w * h
 
         uv_max_surface_widths[image_pack.uv_index] = w if w > uv_max_surface_widths[image_pack.uv_index] else uv_max_surface_widths[image_pack.uv_index]
@@ -79,31 +175,49 @@ def calculate_uv_ratios(images: dict[bpy.types.Image, ImagePackData], uvs: list[
 
     return (uv_max_surface_areas, uv_surface_widths_normalized, uv_surface_heights_normalized)
 
-def size_group_images(group_images, uv_reference_surface_areas) -> defaultdict[int, float]:
-    """Ensures that all images in an image group are scaled to a single ratio with the UV map, returning the
-    amount each group is scaled compared to their canonical sizes.
+def layout_resolution(images: dict[bpy.types.Image, ImagePackData], max_res: int) -> int:
+    """Returns the edge length the layout is normalized against: max_res, or--should the selection hold palette grids
+    alone--the grids' own edge, such that the atlases of an untextured selection aren't padded out to max_res.
     """
 
+    if len(images) == 0 or any(pack.cells == None for pack in images.values()):
+        return max_res
+
+    return min(max(max(pack.size) for pack in images.values()), max_res)
+
+def calculate_group_scales(group_images, uv_reference_surface_areas) -> defaultdict[int, float]:
+    """Computes the amount each group's atlas is scaled compared to the canonical sizes of its images, from image metadata alone."""
+
     group_scales = defaultdict(lambda: 0)
     for i, group in group_images.items():
         group_scale = 0
 
         for pack in group:
-            (w, h) = pack.bl_image.size
+            (w, h) = pack.size
 
             scale = (w * h) / uv_reference_surface_areas[pack.uv_index]
             group_scale = scale if scale > group_scale else group_scale
         
         # As all UV images will be uniformly scaled, we may convert the surface area scale to a dimensional
         # one by taking the square root.
-        group_scale = group_scale**0.5
-        group_scales[i] = group_scale
+        group_scales[i] = group_scale**0.5
+    
+    return group_scales
+
+def size_group_images(group_images, uv_reference_surface_areas) -> defaultdict[int, float]:
+    """Ensures that all images in an image group are scaled to a single ratio with the UV map, returning the
+    amount each group is scaled compared to their canonical sizes.
+    """
+
+    group_scales = calculate_group_scales(group_images, uv_reference_surface_areas)
+    for i, group in group_images.items():
+        group_scale = group_scales[i]
 
         for pack in group:
-            (w, h) = pack.bl_image.size
+            (w, h) = pack.size
 
             scale_factor = group_scale / ((w * h) / uv_reference_surface_areas[pack.uv_index])**0.5
-            pack.image.resize((int(w * scale_factor), int(h * scale_factor)), resize_algorithm(pack))
+            pack.image = resize_image(pack.image, (max(int(w * scale_factor), 1), max(int(h * scale_factor), 1)), resize_algorithm(pack))
     
     return group_scales
 
@@ -135,7 +249,19 @@ def normalize_uvs(uvs: list[list[UVReference]]):
             mesh = reference.object.data
             uv_slot = reference.object_uv_slot
 
-            (offset_u, offset_v) = get_uv_cell_displacement(mesh, uv_slot, reference.contents)
+            # Palette cells are sampled at their centre, regardless of the original UVs.
+            if reference.collapse != None:
+                for loop_index in reference.contents:
+                    mesh.uv_layers[uv_slot].data[loop_index].uv = reference.collapse
+
+                continue
+
+            # Tiled sub-UVs are shifted back from their tile, rather than from wherever their anchor happens to lie.
+            if reference.tile != None:
+                (offset_u, offset_v) = ((reference.tile - 1001) % 10, (reference.tile - 1001) // 10)
+            else:
+                (offset_u, offset_v) = get_uv_cell_displacement(mesh, uv_slot, reference.contents)
+
             for loop_index in reference.contents:
                 loop = mesh.uv_layers[uv_slot].data[loop_index]
 
@@ -145,19 +271,30 @@ def normalize_uvs(uvs: list[list[UVReference]]):
 def rect_area(rect: UVRectangle) -> float:
     return rect.width * rect.height
 
-def place_rect(packing_rects: list[UVRectangle], rect: UVRectangle, stride_x: float, stride_y: float) -> bool:
+def place_rect(packing_rects: list[UVRectangle], rect: UVRectangle) -> bool:
     """Attempts to place a UVRectangle within a normalized space, returning its success."""
 
-    ## Deeply sub-optimal; however, this saves us from persisting a variable outside the function,
-    ## or leveraging a goto. It would be difficult for there to be a sufficient amount of small images to
-    ## make this unacceptably slow.
-    for y in np.arange(0.0, 1.0 - rect.height, stride_y):
-        for x in np.arange(0.0, 1.0 - rect.width, stride_x):
-            success = True
-            for col_rect in packing_rects:
-                success = success and not rect.could_overlap(x, y, col_rect)
-            
-            if success:
+    if rect_area(rect) == 0:
+        (rect.x, rect.y) = (0.0, 0.0)
+
+        return True
+
+    ## Any free position may be slid down and left until it abuts the space's edge or a placed rectangle; hence,
+    ## we need only try the edges of those already placed, rather than scanning at a fixed stride--which tiny
+    ## rectangles would make prohibitively fine.
+    placed = [col_rect for col_rect in packing_rects if col_rect.x != None and rect_area(col_rect) != 0]
+    candidate_xs = sorted({0.0} | {col_rect.x + col_rect.width for col_rect in placed})
+    candidate_ys = sorted({0.0} | {col_rect.y + col_rect.height for col_rect in placed})
+
+    for y in candidate_ys:
+        if y + rect.height > 1.0:
+            break
+
+        for x in candidate_xs:
+            if x + rect.width > 1.0:
+                break
+
+            if not any(rect.could_overlap(x, y, col_rect) for col_rect in placed):
                 (rect.x, rect.y) = (x, y)
 
                 return True
@@ -168,27 +305,19 @@ def pack_rects(packing_rects: list[UVRectangle]) -> bool:
     """Packs a list of UVRectangles into a normalized space, returning its success status. (Destructive)"""
 
     packing_rects.sort(key=rect_area, reverse=True)
-
-    # We'll leverage the minimum image-dimensions as our scan-stride for this, so as to save processing power.
-    (stride_x, stride_y) = (1.0, 1.0)
-    for rect in packing_rects:
-        if rect.width < stride_x:
-            stride_x = rect.width
-        
-        if rect.height < stride_y:
-            stride_y = rect.height
     
     for rect in packing_rects:
-        if not place_rect(packing_rects, rect, stride_x, stride_y):
+        if not place_rect(packing_rects, rect):
             return False
 
     return True
 
-def pack_uvs(uvs: list[list[UVReference]], uv_widths_normalized, uv_heights_normalized) -> list[UVRectangle]:
-    """Packs all UVs in a given UV-list, returning a list of normalized transforms for the positions of the resulting rectangles."""
+def layout_uvs(uv_widths_normalized, uv_heights_normalized) -> list[UVRectangle]:
+    """Computes the normalized placement of every sub-UV's rectangle without touching any mesh data; raises a
+    PackingException should they not fit.
+    """
 
-    packing_rects = [UVRectangle(i, None, None, 0.0, 0.0) for i in range(0, len(uvs))]
-    normalize_uvs(uvs)
+    packing_rects = [UVRectangle(i, None, None, 0.0, 0.0) for i in range(0, len(uv_widths_normalized))]
 
     # Given that Python's zip function's results are lazy, it's cheaper to pre-build the array and iterate thereafter.
     for i, (width, height) in enumerate(zip(uv_widths_normalized, uv_heights_normalized)):
@@ -198,7 +327,18 @@ def pack_uvs(uvs: list[list[UVReference]], uv_widths_normalized, uv_heights_norm
     if not pack_rects(packing_rects):
         raise PackingException
 
-    for rect in packing_rects:
+    return packing_rects
+
+def apply_uv_layout(uvs: list[list[UVReference]], packing_rects: list[UVRectangle]):
+    """Normalizes all UVs in a given UV-list, then transforms them into their packed rectangles. (Destructive)
+
+    Sub-UVs without any image coverage (e.g. lightmap layers) are given zero-area rectangles, and are left untouched.
+    """
+
+    packed_rects = [rect for rect in packing_rects if rect_area(rect) != 0]
+    normalize_uvs([uvs[rect.uv_index] for rect in packed_rects])
+
+    for rect in packed_rects:
         uv_group = uvs[rect.uv_index]
 
         for uv_reference in uv_group:
@@ -210,22 +350,119 @@ def pack_uvs(uvs: list[list[UVReference]], uv_widths_normalized, uv_heights_norm
                 loop.uv[0] = (loop.uv[0] * rect.width) + rect.x
                 loop.uv[1] = (loop.uv[1] * rect.height) + rect.y
 
+def pack_uvs(uvs: list[list[UVReference]], uv_widths_normalized, uv_heights_normalized) -> list[UVRectangle]:
+    """Packs all UVs in a given UV-list, returning a list of normalized transforms for the positions of the resulting rectangles."""
+
+    packing_rects = layout_uvs(uv_widths_normalized, uv_heights_normalized)
+    apply_uv_layout(uvs, packing_rects)
+
     return packing_rects
 
-def pack_images(group_images: defaultdict[int, list[ImagePackData]], group_scales: defaultdict[int, float], transforms: list[UVRectangle], max_res: int):
+def write_png16(image_data: np.ndarray, path: str):
+    """Writes 16-bit pixel data to a PNG; PIL only supports doing so for single-channel images."""
+
+    (height, width, channels) = image_data.shape
+    rows = image_data.astype('>u2').reshape((height, width * channels))
+    raw = b''.join(b'\x00' + row.tobytes() for row in rows)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 16, PNG_COLOR_TYPES[channels], 0, 0, 0)))
+        file.write(chunk(b'IDAT', zlib.compress(raw)))
+        file.write(chunk(b'IEND', b''))
+
+def write_exr(image_data: np.ndarray, path: str):
+    """Writes float pixel data to an OpenEXR file through Blender, which stores images as RGBA."""
+
+    (height, width) = image_data.shape[0:2]
+    (_, has_alpha) = channel_layout(image_data.shape[2])
+
+    bl_image = bpy.data.images.new("FastPack Atlas", width, height, alpha=has_alpha, float_buffer=True)
+    bl_image.pixels.foreach_set(conform_image(image_data, 4, np.dtype(np.float32))[::-1].ravel())
+    bl_image.filepath_raw = path
+    bl_image.file_format = 'OPEN_EXR'
+    bl_image.save()
+
+    bpy.data.images.remove(bl_image)
+
+def save_atlas(group_image: np.ndarray, name: str, output_format: str, generate_mips: bool) -> str:
+    """Writes a composited atlas to the blend file's directory, returning its path."""
+
+    base_path = bpy.path.abspath(f'//{name}')
+
+    if output_format != 'PNG':
+        path = f'{base_path}.dds'
+        save_dds(conform_image(group_image, 4, np.dtype(np.uint8)), path, output_format, generate_mips)
+
+        return path
+
+    if group_image.dtype == np.uint8:
+        path = f'{base_path}.png'
+        Image.fromarray(group_image[:, :, 0] if group_image.shape[2] == 1 else group_image, PIL_MODES[group_image.shape[2]]).save(path)
+
+        return path
+
+    if group_image.dtype == np.uint16:
+        path = f'{base_path}.png'
+        write_png16(group_image, path)
+
+        return path
+
+    path = f'{base_path}.exr'
+    write_exr(group_image, path)
+
+    return path
+
+def pack_images(group_images: defaultdict[int, list[ImagePackData]], group_scales: defaultdict[int, float], transforms: list[UVRectangle], max_res: int,
+    output_format: str = 'PNG', generate_mips: bool = False, lod_count: int = 1) -> dict[int, str]:
+    """Composites each group's images into its atlas, returning the path each full-resolution atlas had been saved to.
+
+    Each atlas takes the narrowest channel count and precision representing all of its group's images. Should
+    lod_count exceed one, each atlas is saved as a chain of {group}_lod{n} levels, each filtered down from its
+    predecessor; as the layout is shared, the packed UVs remain valid for every level.
+    """
+
     transforms_by_uv = {rect.uv_index : rect for rect in transforms}
+    atlas_paths = {}
 
     for i, group in group_images.items():
         scale = group_scales[i]
-        group_image = Image.new('RGBA', (math.floor(max_res * scale), math.floor(max_res * scale)), color=(0, 0, 0, 0))
+        (channels, dtype) = group_mode(group)
+        atlas_size = math.floor(max_res * scale)
+        group_image = np.zeros((atlas_size, atlas_size, channels), dtype=dtype)
 
         for image_pack in group:
-            (_, height) = image_pack.image.size
-
-            x_transform = transforms_by_uv[image_pack.uv_index].x * max_res * scale
-            y_transform = (1.0 - transforms_by_uv[image_pack.uv_index].y) * max_res * scale - height
-            group_image.paste(image_pack.image, (math.floor(x_transform), math.floor(y_transform)))
+            (height, width) = image_pack.image.shape[0:2]
+
+            # Offsets are rounded to the nearest pixel, such that rectangles lying on the pixel grid (e.g. palette grids)
+            # aren't shifted a pixel by floating-point error.
+            x_transform = round(transforms_by_uv[image_pack.uv_index].x * max_res * scale)
+            y_transform = round((1.0 - transforms_by_uv[image_pack.uv_index].y) * max_res * scale - height)
+
+            # Mirroring PIL's paste, portions of an image falling outside of the atlas are clipped.
+            (x0, y0) = (max(x_transform, 0), max(y_transform, 0))
+            (x1, y1) = (min(x_transform + width, atlas_size), min(y_transform + height, atlas_size))
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+            # Groups mixing integer and float sources are saved as float, which holds linear values alone.
+            srgb = image_pack.cells == None and image_pack.bl_image.colorspace_settings.name == 'sRGB'
+            tile = conform_image(image_pack.image, channels, dtype, srgb)
+            group_image[y0:y1, x0:x1] = tile[y0 - y_transform:y1 - y_transform, x0 - x_transform:x1 - x_transform]
         
-        group_image.save(f'{bpy.path.abspath("//")}/{i}.png')
+        if lod_count <= 1:
+            atlas_paths[i] = save_atlas(group_image, str(i), output_format, generate_mips)
+            continue
+
+        (_, has_alpha) = channel_layout(channels)
+        for lod in range(lod_count):
+            path = save_atlas(group_image, f'{i}_lod{lod}', output_format, generate_mips)
+            atlas_paths.setdefault(i, path)
 
+            if lod + 1 < lod_count:
+                group_image = downsample_half(group_image, has_alpha)
 
+    return atlas_paths
@@ -1,11 +1,25 @@
 from dataclasses import dataclass
 from collections import defaultdict
 from logging import root
-from PIL import Image
 import numpy as np
-from .shader_graph import fetch_search_roots, build_node_relations, grab_socket_images, grab_socket_image_nodes
+from .shader_graph import fetch_search_roots, build_node_relations, grab_socket_images, grab_socket_image_nodes, material_constants
+from ..exceptions import ImageLoadException
+import math
+import os
+import struct
+import tempfile
 import bpy
 
+## Edge length, in pixels of a max_res atlas, of the cells holding constant socket values within the last level of an
+## LOD chain. As a palette grid is the sole image on its sub-UV, its group is never scaled below 1 (see
+## calculate_group_scales); cells hence keep their size.
+PALETTE_CELL_SIZE = 4
+
+## TIFF tags describing sample precision, and the SampleFormat value denoting floats.
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_SAMPLE_FORMAT = 339
+TIFF_FLOAT_SAMPLES = 3
+
 @dataclass
 class UVReference:
     """Provides a list of loop indices and their commensurate lookup information. Used in a list to keep track of related, cross-object UVs.
@@ -14,31 +28,100 @@ class UVReference:
         object (bpy.types.Object): The given UV loops' object.
         object_uv_slot (int): The given UV loops' UV slot within the object.
         contents ([int]): List of UV loop indices.
+        collapse ((float, float)): The normalized point the loops are collapsed onto, should they sample a palette cell.
+        tile (int): The UDIM tile the loops lie within, should they sample a tiled image.
     """
     object: bpy.types.Object
     object_uv_slot: int
     contents: list[int]
+    collapse: tuple[float, float] = None
+    tile: int = None
 
 @dataclass
 class ImagePackData:
     """Element describing an individual texture requiring packaging.
     
     Attributes:
-        image (Image): PIL Image representing the Blender image.
-        bl_image (bpy.types.Image): Originating Blender image object.
+        image (np.ndarray): Top-down (height, width, channels) pixel data at the source's native channel count and precision.
+        bl_image (bpy.types.Image): Originating Blender image object; None for palette grids.
         uv_index (int): An index towards an entry in a list of lists of UVReferences.
+        cells ([(float)]): The linear constant each cell of a palette grid stands in for, or None where its material lacks
+            the socket; None for images.
+        materials ([bpy.types.Material]): The material owning each cell of a palette grid.
+        tile (int): The UDIM tile number of a tiled image; each tile is packed as its own image.
+        srgb (bool): Whether a palette grid's colors are sRGB-encoded, matching the atlas it is packed into.
+        palette_dtype (np.dtype): The precision of the atlas a palette grid is packed into.
+        cell_size (int): The edge length, in pixels, of each cell of a palette grid.
     """
 
-    image: Image
+    image: np.ndarray
     bl_image: bpy.types.Image
     uv_index: int
     interpolation: str
     socket: str
+    cells: list[tuple[float, ...]] = None
+    materials: list[bpy.types.Material] = None
+    tile: int = None
+    srgb: bool = True
+    palette_dtype: np.dtype = np.dtype(np.uint8)
+    cell_size: int = PALETTE_CELL_SIZE
+
+    @property
+    def size(self) -> tuple[int, int]:
+        if self.cells != None:
+            (columns, rows) = palette_grid(len(self.cells))
+            return (columns * self.cell_size, rows * self.cell_size)
+
+        if self.tile != None:
+            return tile_size(self.bl_image, self.tile)
+
+        return tuple(self.bl_image.size)
+
+    @property
+    def channels(self) -> int:
+        """The channel count of the source data, prior to any trimming on load."""
+
+        if self.cells != None:
+            return min(len(next(cell for cell in self.cells if cell != None)), 3)
+
+        return self.bl_image.channels
+
+    @property
+    def dtype(self) -> np.dtype:
+        if self.cells != None:
+            return self.palette_dtype
+
+        return image_dtype(self.bl_image)
+
+    @property
+    def source(self) -> tuple:
+        """Identifies the pixel data decoded; shared by the packs of an untiled image pasted into several UDIM tiles."""
+
+        if self.cells != None:
+            return (None, self.socket)
+
+        return (self.bl_image, self.tile)
 
     ## For convenience--as our process operates in phases due to the
     ## global nature of the final atlas' data.
-    def load_image(self):
-        self.image = load_image(self.bl_image)
+    def load_image(self, decoded: dict[tuple, np.ndarray] = None):
+        """Decodes the pack's pixel data; should a dictionary of decoded sources be given, data already decoded for
+        another pack sharing this one's source is reused rather than decoded anew.
+        """
+
+        if decoded != None and self.source in decoded:
+            self.image = decoded[self.source]
+            return
+
+        if self.cells != None:
+            self.image = load_palette(self.cells, self.cell_size, self.channels, self.srgb, self.dtype)
+        elif self.tile != None:
+            self.image = load_image_tile(self.bl_image, self.tile)
+        else:
+            self.image = load_image(self.bl_image)
+
+        if decoded != None:
+            decoded[self.source] = self.image
 
 class MaterialUVSymbol:
     """A symbol representing an as of-yet unresolved reference to a model's sub-UV table.
@@ -59,115 +142,597 @@ class MaterialUVSymbol:
     def __str__(self):
         return f'Link: {self.uv_index} | {self.images}'
 
-def load_image(bl_image: bpy.types.Image) -> Image:
-    """Generates a PIL Image from a Blender image."""
+def tiff_sample_format(read) -> tuple[int, int]:
+    """Reads the bits per sample and sample format (1 for integers, 3 for floats) from a TIFF's first directory, given
+    a read(offset, size) callable over its bytes; or None, should they be unreadable.
+    """
+
+    try:
+        header = read(0, 8)
+        order = {b'II': '<', b'MM': '>'}.get(header[0:2])
+        if order == None or struct.unpack(order + 'H', header[2:4])[0] != 42:
+            return None
+
+        ifd_offset = struct.unpack(order + 'I', header[4:8])[0]
+        entry_count = struct.unpack(order + 'H', read(ifd_offset, 2))[0]
+        entries = read(ifd_offset + 2, entry_count * 12)
+
+        (bits, sample_format) = (None, 1)
+        for i in range(entry_count):
+            (tag, _, value_count, field) = struct.unpack(order + 'HHI4s', entries[i * 12:(i + 1) * 12])
+            if not tag in (TIFF_BITS_PER_SAMPLE, TIFF_SAMPLE_FORMAT):
+                continue
+
+            # Both are SHORTs per sample, held inline unless there are more than two; samples share them in practice.
+            data = field if value_count <= 2 else read(struct.unpack(order + 'I', field)[0], 2)
+            value = struct.unpack(order + 'H', data[0:2])[0]
+
+            if tag == TIFF_BITS_PER_SAMPLE:
+                bits = value
+            else:
+                sample_format = value
+
+        return None if bits == None else (bits, sample_format)
+    except (struct.error, OSError):
+        return None
+
+def image_sample_format(bl_image: bpy.types.Image) -> tuple[int, int]:
+    """Reads the bits per sample and sample format of a TIFF-backed Blender image, from its packed data or file."""
+
+    if bl_image.packed_file != None:
+        data = bl_image.packed_file.data
+        return tiff_sample_format(lambda offset, size: data[offset:offset + size])
+
+    path = bl_image.filepath
+    if bl_image.source == 'TILED':
+        path = tile_filepath(path, bl_image.tiles[0].number, bl_image.tiles[0].number)
+
+    try:
+        with open(bpy.path.abspath(path), 'rb') as file:
+            def read(offset: int, size: int) -> bytes:
+                file.seek(offset)
+                return file.read(size)
+
+            return tiff_sample_format(read)
+    except (OSError, ImageLoadException):
+        return None
+
+def image_dtype(bl_image: bpy.types.Image) -> np.dtype:
+    """Infers the per-channel precision of a Blender image's source data."""
+
+    if not bl_image.is_float:
+        return np.dtype(np.uint8)
+
+    # Blender decodes 16-bit integer formats into float buffers; we return them to their original depth. PNGs hold
+    # integers alone, whereas TIFFs may hold 16-bit integers or 16/32-bit floats alike.
+    if bl_image.file_format == 'PNG':
+        return np.dtype(np.uint16)
+
+    if bl_image.file_format == 'TIFF':
+        sample_format = image_sample_format(bl_image)
+        if sample_format != None and sample_format[0] <= 16 and sample_format[1] != TIFF_FLOAT_SAMPLES:
+            return np.dtype(np.uint16)
+
+    return np.dtype(np.float32)
+
+def linear_to_srgb(data: np.ndarray) -> np.ndarray:
+    """Applies the sRGB transfer function to linear, normalized color data."""
+
+    return np.where(data <= 0.0031308, data * 12.92, 1.055 * np.power(np.maximum(data, 0.0031308), 1 / 2.4) - 0.055)
+
+def srgb_to_linear(data: np.ndarray) -> np.ndarray:
+    """Inverts the sRGB transfer function over normalized color data."""
+
+    return np.where(data <= 0.04045, data / 12.92, np.power((np.maximum(data, 0.04045) + 0.055) / 1.055, 2.4))
+
+def color_channel_count(channels: int) -> int:
+    """Returns the number of leading color channels in pixel data of a given channel count, excluding alpha."""
+
+    return channels - (channels + 1) % 2
+
+def trim_channels(image_data: np.ndarray) -> np.ndarray:
+    """Discards channels carrying no information; that is, uniformly opaque alpha and the chroma of grayscale data."""
+
+    channels = image_data.shape[2]
+
+    if channels in (2, 4) and np.all(image_data[:, :, -1] >= 1.0):
+        image_data = image_data[:, :, 0:-1]
+        channels -= 1
+
+    if channels >= 3 and np.array_equal(image_data[:, :, 0], image_data[:, :, 1]) and np.array_equal(image_data[:, :, 0], image_data[:, :, 2]):
+        image_data = image_data[:, :, [0] + list(range(3, channels))]
+
+    return image_data
+
+def quantize(image_data: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Converts normalized float pixel data to the given precision."""
+
+    if not np.issubdtype(dtype, np.integer):
+        return image_data.astype(dtype)
+
+    max_value = np.iinfo(dtype).max
+    return np.rint(np.clip(image_data, 0.0, 1.0) * max_value).astype(dtype)
+
+def load_image(bl_image: bpy.types.Image) -> np.ndarray:
+    """Generates top-down pixel data from a Blender image, preserving its meaningful channels and precision."""
 
-    bl_data = np.asarray(bl_image.pixels)
     (width, height) = bl_image.size
     channels = bl_image.channels
+    dtype = image_dtype(bl_image)
 
-    default_channels = np.array([0.0, 0.0, 0.0, 1.0])
-    image_data = np.tile(default_channels, (height, width, 1))
-    bl_data = bl_data.reshape((height, width, channels))
-    
-    image_data[:, :, 0:channels] = bl_data
-    image_data *= 255
-    image_data = np.rint(image_data).astype('uint8')
-    
-    image = Image.fromarray(image_data)
-    image = image.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+    bl_data = np.empty(width * height * channels, dtype=np.float32)
+    bl_image.pixels.foreach_get(bl_data)
+    image_data = trim_channels(bl_data.reshape((height, width, channels))[::-1])
+
+    # Float buffers of color images are linearized on load; integer output must be re-encoded to match its source.
+    if dtype == np.uint16 and bl_image.colorspace_settings.name == 'sRGB':
+        color_channels = color_channel_count(image_data.shape[2])
+        image_data[:, :, 0:color_channels] = linear_to_srgb(image_data[:, :, 0:color_channels])
+
+    return quantize(image_data, dtype)
+
+def palette_grid(cell_count: int) -> tuple[int, int]:
+    """Returns the (columns, rows) of the squarest grid holding a given number of palette cells."""
 
-    return image
+    columns = max(math.ceil(cell_count**0.5), 1)
+    return (columns, max(math.ceil(cell_count / columns), 1))
+
+def palette_cell_center(cell: int, cell_count: int) -> tuple[float, float]:
+    """Returns the normalized UV coordinate of a palette cell's centre within its grid; cells fill rows top-down."""
+
+    (columns, rows) = palette_grid(cell_count)
+    return ((cell % columns + 0.5) / columns, 1.0 - (cell // columns + 0.5) / rows)
+
+def load_palette(cells: list[tuple[float, ...]], cell_size: int, channels: int, srgb: bool, dtype: np.dtype) -> np.ndarray:
+    """Generates top-down pixel data for a palette grid, filling each cell with its encoded constant."""
+
+    (columns, rows) = palette_grid(len(cells))
+    image_data = np.zeros((rows * cell_size, columns * cell_size, channels), dtype=np.float32)
+
+    for i, value in enumerate(cells):
+        if value == None:
+            continue
+
+        (x, y) = ((i % columns) * cell_size, (i // columns) * cell_size)
+        image_data[y:y + cell_size, x:x + cell_size] = encode_constant(value, srgb)
+
+    return quantize(image_data, dtype)
+
+def tile_size(bl_image: bpy.types.Image, tile_number: int) -> tuple[int, int]:
+    """Fetches the dimensions of a single tile of a tiled image, falling back upon the image's own where unreported."""
+
+    for tile in bl_image.tiles:
+        if tile.number == tile_number:
+            return tuple(getattr(tile, 'size', bl_image.size))
+
+    return tuple(bl_image.size)
+
+def tile_filepath(filepath: str, first_tile: int, tile_number: int) -> str:
+    """Substitutes a tile number into the file name of a tiled image's path, leaving its directories untouched.
+    Raises an ImageLoadException should the file name carry no tile number.
+    """
+
+    split = max(filepath.rfind('/'), filepath.rfind('\\')) + 1
+    (directory, name) = (filepath[:split], filepath[split:])
+
+    if '<UDIM>' in name:
+        return directory + name.replace('<UDIM>', str(tile_number))
+
+    # Tile numbers conventionally trail the file name (e.g. 'albedo.1001.png'); we hence substitute the last occurrence.
+    (head, separator, tail) = name.rpartition(str(first_tile))
+    if separator == '':
+        raise ImageLoadException(f'No tile number could be found within "{name}"')
+
+    return directory + head + str(tile_number) + tail
+
+def load_image_file(path: str, colorspace: str) -> np.ndarray:
+    """Decodes an image file through Blender, discarding the datablock afterwards."""
+
+    file_image = bpy.data.images.load(path, check_existing=False)
+    file_image.colorspace_settings.name = colorspace
+
+    try:
+        return load_image(file_image)
+    finally:
+        bpy.data.images.remove(file_image)
+
+def load_image_tile(bl_image: bpy.types.Image, tile_number: int) -> np.ndarray:
+    """Decodes a single tile of a tiled image, loading its file on demand such that untouched tiles are never read.
+    Raises an ImageLoadException should the tile be neither packed nor found on disk.
+    """
+
+    colorspace = bl_image.colorspace_settings.name
+
+    # Blender exposes only the first tile of a tiled image through pixels; packed tiles are decoded from their own data.
+    if len(bl_image.packed_files) > 0:
+        packed = next((entry for entry in bl_image.packed_files if getattr(entry, 'tile_number', None) == tile_number), None)
+        if packed == None:
+            raise ImageLoadException(f'Tile {tile_number} of "{bl_image.name}" is not packed')
+
+        (handle, path) = tempfile.mkstemp(suffix=os.path.splitext(packed.filepath)[1])
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                file.write(packed.packed_file.data)
+
+            return load_image_file(path, colorspace)
+        finally:
+            os.remove(path)
+
+    tile_path = bpy.path.abspath(tile_filepath(bl_image.filepath, bl_image.tiles[0].number, tile_number))
+    if not os.path.isfile(tile_path):
+        raise ImageLoadException(f'Tile {tile_number} of "{bl_image.name}" was not found at {tile_path}')
+
+    return load_image_file(tile_path, colorspace)
+
+def loop_tile_numbers(mesh: bpy.types.Mesh, uv_slot: int) -> np.ndarray:
+    """Assigns each loop the UDIM tile its polygon's UV centroid lies within; polygons are never split across tiles."""
+
+    polygon_count = len(mesh.polygons)
+    loop_starts = np.empty(polygon_count, dtype=np.int32)
+    loop_totals = np.empty(polygon_count, dtype=np.int32)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+
+    uv_data = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    mesh.uv_layers[uv_slot].data.foreach_get('uv', uv_data)
+    uv_data = uv_data.reshape((-1, 2))
+
+    loop_offsets = np.arange(loop_totals.sum()) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_indices = np.repeat(loop_starts, loop_totals) + loop_offsets
+    polygon_indices = np.repeat(np.arange(polygon_count), loop_totals)
+
+    centroids = np.zeros((polygon_count, 2), dtype=np.float64)
+    np.add.at(centroids, polygon_indices, uv_data[loop_indices])
+    centroids /= np.maximum(loop_totals, 1)[:, np.newaxis]
+
+    cells = np.floor(centroids).astype(np.int32)
+    polygon_tiles = 1001 + np.clip(cells[:, 0], 0, 9) + 10 * np.maximum(cells[:, 1], 0)
+
+    res = np.zeros(len(mesh.loops), dtype=np.int32)
+    res[loop_indices] = polygon_tiles[polygon_indices]
+
+    return res
 
 def fetch_obj_material_loops(obj: bpy.types.Object) -> list[list[list[int]]]:
     mesh: bpy.types.Mesh = obj.data
-    res = [[[] for uv in mesh.uv_layers] for mat in obj.material_slots]
+    slot_count = len(obj.material_slots)
+
+    # Loop partitions are independent of the UV layer; we hence compute them once, in bulk, and share them.
+    material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', material_indices)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+
+    loop_materials = np.repeat(np.clip(material_indices, 0, max(slot_count - 1, 0)), loop_totals)
+    loop_offsets = np.arange(loop_totals.sum()) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_indices = np.repeat(loop_starts, loop_totals) + loop_offsets
+
+    res = []
+    for i in range(slot_count):
+        material_loops = loop_indices[loop_materials == i].tolist()
+        res.append([material_loops for uv in mesh.uv_layers])
     
-    default_uv = mesh.uv_layers.active
-    for i, uv in enumerate(mesh.uv_layers):
-        uv_loops_accounted = set()
-        uv.active = True
-        
-        for poly in mesh.polygons:
-            for loop_range in poly.loop_indices:
-                if not loop_range in uv_loops_accounted:
-                    res[poly.material_index][i].append(loop_range)
-                    uv_loops_accounted.add(loop_range)
+    return res
+
+def object_signature(obj: bpy.types.Object) -> tuple:
+    """A cheap summary of the object state our analysis depends upon; should it change, the object must be re-analysed."""
+
+    mesh: bpy.types.Mesh = obj.data
+
+    material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', material_indices)
+
+    active_uv = mesh.uv_layers.active.name if mesh.uv_layers.active != None else None
+    return (mesh.as_pointer(), len(mesh.polygons), len(mesh.loops), tuple(uv.name for uv in mesh.uv_layers), active_uv,
+        tuple(slot.material.as_pointer() if slot.material != None else 0 for slot in obj.material_slots), hash(material_indices.tobytes()))
+
+def material_signature(mat: bpy.types.Material) -> tuple:
+    """A cheap summary of a material's node tree, catching structural edits missed by depsgraph tracking."""
+
+    return (mat.node_tree.as_pointer(), len(mat.node_tree.nodes), len(mat.node_tree.links))
+
+@dataclass
+class ObjectAnalysis:
+    """Cached analysis of a single object.
+
+    Attributes:
+        signature (tuple): The object_signature the analysis had been computed against.
+        material_loops ([[[int]]]): The object's loop indices, by material slot and UV slot.
+    """
+
+    signature: tuple
+    material_loops: list[list[list[int]]]
+
+@dataclass
+class MaterialAnalysis:
+    """Cached analysis of a single material, as seen through a given active UV map.
+
+    Attributes:
+        signature (tuple): The material_signature the analysis had been computed against.
+        images ([(bpy.types.Image, str, str, str)]): The material's images, alongside their UV map, interpolation and source socket.
+        constants ({str -> (float)}): The constant inputs of an image-less material's sole shader, by socket; None should it not qualify for a palette cell.
+    """
+
+    signature: tuple
+    images: list[(bpy.types.Image, str, str, str)]
+    constants: dict[str, tuple[float, ...]] = None
+
+class AnalysisCache:
+    """Retains per-object and per-material analysis across refreshes, keyed by datablock identity, such that
+    only new or modified datablocks need be re-analysed.
+    """
+
+    def __init__(self, node_blacklist: set[bpy.types.Node]):
+        self.blacklist = node_blacklist
+        self.objects: dict[int, ObjectAnalysis] = {}
+        self.materials: dict[tuple[int, str], MaterialAnalysis] = {}
+        self.dirty: set[int] = set()
+
+    def mark_updates(self, updates):
+        """Invalidates the analyses of datablocks reported as updated by the depsgraph."""
+
+        for update in updates:
+            updated_id = update.id.original
+
+            if isinstance(updated_id, bpy.types.Object) and (update.is_updated_geometry or update.is_updated_shading):
+                self.dirty.add(updated_id.as_pointer())
+
+            elif isinstance(updated_id, bpy.types.Material):
+                self.dirty.add(updated_id.as_pointer())
+
+            # Material node trees are embedded, and are reported apart from their owning material.
+            elif isinstance(updated_id, bpy.types.NodeTree):
+                self.dirty.add(updated_id.as_pointer())
+
+    def object_loops(self, obj: bpy.types.Object) -> list[list[list[int]]]:
+        key = obj.as_pointer()
+        signature = object_signature(obj)
+        cached = self.objects.get(key)
+
+        if cached == None or cached.signature != signature:
+            cached = ObjectAnalysis(signature, fetch_obj_material_loops(obj))
+            self.objects[key] = cached
+
+        return cached.material_loops
+
+    def material_analysis(self, mesh: bpy.types.Mesh, mat: bpy.types.Material) -> MaterialAnalysis:
+        key = (mat.as_pointer(), mesh.uv_layers.active.name)
+        signature = material_signature(mat)
+        cached = self.materials.get(key)
+
+        if cached == None or cached.signature != signature:
+            root_nodes = fetch_search_roots(build_node_relations(mat), self.blacklist)
+            mat_images = [elem for root_node in root_nodes for socket in root_node.n_to for elem in grab_socket_images(mesh, root_node, socket)]
+            constants = material_constants(root_nodes) if len(mat_images) == 0 else None
+
+            cached = MaterialAnalysis(signature, mat_images, constants)
+            self.materials[key] = cached
+
+        return cached
+
+    def invalidate(self):
+        """Discards the analyses of all datablocks updated since the last refresh."""
+
+        self.objects = {key : analysis for key, analysis in self.objects.items() if not key in self.dirty}
+        self.materials = {key : analysis for key, analysis in self.materials.items() if not (key[0] in self.dirty or analysis.signature[0] in self.dirty)}
+        self.dirty.clear()
+
+def link_material_images(obj: bpy.types.Object, material_uvs: list[list[int]], mat_images: list[(bpy.types.Image, str, str, str)],
+    images: dict[bpy.types.Image, ImagePackData], uvs: list[list[UVReference]], loop_tiles: dict[tuple[bpy.types.Object, int], np.ndarray] = None):
+    """Resolves the sub-UVs of a single material slot, registering its images against them.
+
+    UV slots sampling tiled images are split by UDIM tile, each used tile forming its own sub-UV and image, keyed by
+    (image, tile). Untiled images sampled through such a slot repeat across every tile, and are hence pasted into each.
+    Should a loop_tiles dictionary be given, each (object, UV slot)'s loop tile numbers are computed once across calls.
+    """
+
+    if loop_tiles == None:
+        loop_tiles = {}
+
+    uv_slots = {uv.name : i for i, uv in enumerate(obj.data.uv_layers)}
+
+    # Each of these corresponds to a UV--and, should it be split, a tile--in material_uvs.
+    tiled_slots = {uv_slots[uv] for (image, uv, _, _) in mat_images if image.source == 'TILED'}
+    slot_tiles = {}
+    for uv_slot, loops in enumerate(material_uvs):
+        if uv_slot in tiled_slots and len(loops) > 0:
+            if not (obj, uv_slot) in loop_tiles:
+                loop_tiles[(obj, uv_slot)] = loop_tile_numbers(obj.data, uv_slot)
+
+            loop_indices = np.array(loops, dtype=np.int32)
+            slot_loop_tiles = loop_tiles[(obj, uv_slot)][loop_indices]
+            slot_tiles[uv_slot] = {int(tile) : loop_indices[slot_loop_tiles == tile].tolist() for tile in np.unique(slot_loop_tiles)}
+        else:
+            slot_tiles[uv_slot] = {None : loops}
+
+    uv_links = {(uv_slot, tile) : MaterialUVSymbol(None, None) for uv_slot, tiles in slot_tiles.items() for tile in tiles}
     
-    default_uv.active = True
+    parsed_images = set()
     
-    return res
+    for (image, uv, interp, src_socket) in mat_images:
+        if image in parsed_images:
+            continue
+        
+        parsed_images.add(image)
+        uv_slot = uv_slots[uv]
+
+        if image.source == 'TILED':
+            image_tiles = {tile.number for tile in image.tiles}
+            targets = [((uv_slot, tile), (image, tile)) for tile in slot_tiles[uv_slot] if tile in image_tiles]
+        else:
+            targets = [((uv_slot, tile), image if tile == None else (image, tile)) for tile in slot_tiles[uv_slot]]
+
+        for (link_key, image_key) in targets:
+            owning_mat_uv = uv_links[link_key]
+            
+            # No need to explicitly scan this image later; hence, we continue,
+            # updating our uv link resolution if necessary.
+            if image_key in images:
+                if owning_mat_uv.uv_index == None:
+                    owning_mat_uv.uv_index = images[image_key].uv_index
+                
+                continue
+            
+            owning_mat_uv.images.append((image, interp, src_socket))
+
+    for (uv_slot, tile), link in uv_links.items():
+        contents = slot_tiles[uv_slot][tile]
+
+        # Should the link be divorced from all discovered
+        # sub-UVs...
+        if len(contents) == 0:
+            continue
+
+        if link.uv_index == None:
+            link.uv_index = len(uvs)
+            uvs.append([]) # We instantiate a new sub-UV list.
+        
+        uv_index = link.uv_index
+        
+        link_ref = UVReference(obj, uv_slot, contents, tile=tile)
+        uvs[uv_index].append(link_ref)
+        
+        for (image, interp, src_socket) in link.images:
+            if tile == None:
+                images[image] = ImagePackData(None, image, uv_index, interp, src_socket)
+            elif image.source == 'TILED':
+                images[(image, tile)] = ImagePackData(None, image, uv_index, interp, src_socket, tile=tile)
+            else:
+                images[(image, tile)] = ImagePackData(None, image, uv_index, interp, src_socket)
+
+def palette_sockets(constant_materials: list[tuple], images: dict[bpy.types.Image, ImagePackData]) -> set[str]:
+    """Determines which constant sockets warrant palette cells: those sampled from images elsewhere in the selection,
+    or whose values differ between materials. Sockets with values outside of the normalized range are excluded.
+    """
+
+    socket_values = defaultdict(set)
+    for (_, _, _, analysis) in constant_materials:
+        for socket, value in analysis.constants.items():
+            socket_values[socket].add(value)
+
+    image_sockets = {pack.socket for pack in images.values()}
+
+    return {socket for socket, values in socket_values.items()
+        if (socket in image_sockets or len(values) > 1) and all(0.0 <= c <= 1.0 for value in values for c in value)}
+
+def encode_constant(value: tuple[float, ...], srgb: bool = False) -> tuple[float, ...]:
+    """Converts a socket's linear constant into the normalized values its palette cell holds; colors lose their alpha,
+    and values are sRGB-encoded should srgb be set.
+    """
 
-def retrieve_images_and_uvs(target_objs: list[bpy.types.Object], node_blacklist: set[bpy.types.Node]) -> tuple[dict[bpy.types.Image, ImagePackData], list[list[UVReference]]]:
-    """Given a list of target objects, isolate all independent images and UV map partitions present."""
+    value = np.array(value[0:3])
+    return tuple(float(c) for c in (linear_to_srgb(value) if srgb else value))
 
+def size_palettes(images: dict[bpy.types.Image, ImagePackData], lod_count: int):
+    """Grows each palette grid's cells such that they remain PALETTE_CELL_SIZE wide within the last of lod_count levels,
+    as each level halves its predecessor; smaller cells would be averaged into their neighbours.
+    """
+
+    for pack in images.values():
+        if pack.cells != None:
+            pack.cell_size = PALETTE_CELL_SIZE << (max(lod_count, 1) - 1)
+
+def configure_palettes(group_images: defaultdict[int, list[ImagePackData]]):
+    """Matches each palette grid's precision and encoding to the atlas it is packed into: float atlases hold linear
+    values, whereas integer atlases of sRGB images hold sRGB-encoded ones. Atlases of palette grids alone are
+    sRGB for colors, and Non-Color otherwise.
+    """
+
+    for group in group_images.values():
+        sources = [pack for pack in group if pack.cells == None]
+
+        dtype = np.dtype(np.uint8)
+        for pack in sources:
+            dtype = np.promote_types(dtype, pack.dtype)
+
+        colorspace = sources[0].bl_image.colorspace_settings.name if len(sources) > 0 else None
+
+        for pack in group:
+            if pack.cells != None:
+                pack.palette_dtype = dtype
+                pack.srgb = pack.channels > 1 if colorspace == None else colorspace == 'sRGB' and np.issubdtype(dtype, np.integer)
+
+def retrieve_images_and_uvs(target_objs: list[bpy.types.Object], node_blacklist: set[bpy.types.Node], cache: AnalysisCache = None) -> tuple[dict[bpy.types.Image, ImagePackData], list[list[UVReference]]]:
+    """Given a list of target objects, isolate all independent images and UV map partitions present. Should a cache
+    be provided, unchanged objects and materials reuse their prior analysis.
+
+    Image-less materials driven solely by constants are assigned cells within a palette grid per socket, keyed by
+    (None, socket), onto which their active UV map is collapsed.
+    """
+
+    if cache == None:
+        cache = AnalysisCache(node_blacklist)
+
+    cache.invalidate()
     images = {}
     uvs = []
 
+    # Constant-driven materials are deferred until every image-driven socket is known.
+    constant_materials = []
+    loop_tiles = {}
+
     for obj in target_objs:
         mesh = obj.data
-        
-        uv_slots = {uv.name : i for i, uv in enumerate(mesh.uv_layers)}
-        obj_uvs = fetch_obj_material_loops(obj)
+
+        # Meshes without a UV map have no loops to remap onto an atlas.
+        if mesh.uv_layers.active == None:
+            continue
+
+        obj_uvs = cache.object_loops(obj)
 
         for i, slot in enumerate(obj.material_slots):
-            mat = slot.material
-            
-            material_uvs = obj_uvs[i]
-            
-            # Each of these corresponds to a UV in material_uvs.
-            uv_links = [MaterialUVSymbol(None, None) for _ in material_uvs]
-            
-            root_nodes = fetch_search_roots(build_node_relations(mat), node_blacklist)
-            mat_images = [elem for root_node in root_nodes for socket in root_node.n_to for elem in grab_socket_images(mesh, root_node, socket)]
-            
-            parsed_images = set()
-            
-            for (image, uv, interp, src_socket) in mat_images:
-                if image in parsed_images:
-                    continue
-                
-                parsed_images.add(image)
-                owning_mat_uv = uv_links[uv_slots[uv]]
-                
-                # No need to explicitly scan this image later; hence, we continue,
-                # updating our uv link resolution if necessary.
-                if image in images:
-                    if owning_mat_uv.uv_index == None:
-                        owning_mat_uv.uv_index = images[image].uv_index
-                    
-                    continue
-                
-                owning_mat_uv.images.append((image, interp, src_socket))
+            analysis = cache.material_analysis(mesh, slot.material)
 
-            for uv_slot, link in enumerate(uv_links):
-                # Should the link be divorced from all discovered
-                # sub-UVs...
-                if len(material_uvs[uv_slot]) == 0:
-                    continue
+            if analysis.constants != None and len(analysis.constants) > 0:
+                constant_materials.append((obj, slot.material, obj_uvs[i], analysis))
+                continue
+
+            link_material_images(obj, obj_uvs[i], analysis.images, images, uvs, loop_tiles)
+
+    sockets = palette_sockets(constant_materials, images)
+    palette_analyses = {}
+    palette_references = []
+
+    for (obj, mat, material_uvs, analysis) in constant_materials:
+        if sockets.isdisjoint(analysis.constants.keys()):
+            link_material_images(obj, material_uvs, analysis.images, images, uvs, loop_tiles)
+            continue
+
+        active_slot = [uv.name for uv in obj.data.uv_layers].index(obj.data.uv_layers.active.name)
+        if len(material_uvs[active_slot]) == 0:
+            continue
+
+        palette_analyses.setdefault(mat, analysis)
+        palette_references.append((obj, active_slot, material_uvs[active_slot], mat))
+
+    if len(palette_analyses) == 0:
+        return (images, uvs)
+
+    # Every palette material shares one sub-UV, holding a grid of one cell per material; this keeps the packer's
+    # rectangle count independent of the number of palette materials.
+    materials = list(palette_analyses.keys())
+    cell_indices = {mat : i for i, mat in enumerate(materials)}
+    palette_uv = len(uvs)
+    uvs.append([UVReference(obj, uv_slot, loops, palette_cell_center(cell_indices[mat], len(materials))) for (obj, uv_slot, loops, mat) in palette_references])
+
+    for socket in sockets:
+        cells = [palette_analyses[mat].constants.get(socket) for mat in materials]
+
+        if any(cell != None for cell in cells):
+            images[(None, socket)] = ImagePackData(None, None, palette_uv, 'Closest', socket, cells, materials)
 
-                if link.uv_index == None:
-                    link.uv_index = len(uvs)
-                    uvs.append([]) # We instantiate a new sub-UV list.
-                
-                uv_index = link.uv_index
-                
-                link_ref = UVReference(obj, uv_slot, material_uvs[uv_slot])
-                uvs[uv_index].append(link_ref)
-                
-                for (image, interp, src_socket) in link.images:
-                    image_data = ImagePackData(None, image, uv_index, interp, src_socket)
-                    images[image] = image_data
-    
     return (images, uvs)
 
-def load_atlases(groups: list[int]) -> list[bpy.types.Image]:
-    return [bpy.data.images.load(f"//{group}.png") for group in groups]
+def load_atlases(atlas_paths: dict[int, str]) -> dict[int, bpy.types.Image]:
+    # Atlases are referenced relative to the blend file, such that baked projects may be moved.
+    return {group : bpy.data.images.load(bpy.path.relpath(path)) for group, path in atlas_paths.items()}
 
-def replace_images(target_objs: list[bpy.types.Object], node_blacklist: set[bpy.types.Node], group_images: defaultdict[int, list[ImagePackData]], baked_textures: list[bpy.types.Image]):
+def replace_images(target_objs: list[bpy.types.Object], node_blacklist: set[bpy.types.Node], group_images: defaultdict[int, list[ImagePackData]], baked_textures: dict[int, bpy.types.Image]):
     """Replaces shader images with their atlased alternatives. (Destructive)"""
 
-    image_groups = {pack.bl_image : group_index for group_index, pack_list in group_images.items() for pack in pack_list}
+    image_groups = {pack.bl_image : group_index for group_index, pack_list in group_images.items() for pack in pack_list if pack.cells == None}
 
     processed_mats = set()
     for obj in target_objs:
@@ -183,4 +748,36 @@ def replace_images(target_objs: list[bpy.types.Object], node_blacklist: set[bpy.
             for image_node in mat_images:
                 color_type = image_node.image.colorspace_settings.name
                 image_node.image = baked_textures[image_groups[image_node.image]]
-                image_node.image.colorspace_settings.name = color_type
\ No newline at end of file
+
+                # Float atlases hold linear values throughout, sRGB sources having been linearized into them.
+                if not (image_node.image.is_float and color_type == 'sRGB'):
+                    image_node.image.colorspace_settings.name = color_type
+
+def bind_palette_cells(node_blacklist: set[bpy.types.Node], group_images: defaultdict[int, list[ImagePackData]], baked_textures: dict[int, bpy.types.Image]):
+    """Drives each palette cell's socket with an image node sampling its atlas. (Destructive)"""
+
+    for group_index, pack_list in group_images.items():
+        # Atlases built solely of palette cells have no source colorspace to inherit.
+        palette_only = all(pack.cells != None for pack in pack_list)
+
+        for pack in pack_list:
+            if pack.cells == None:
+                continue
+
+            if palette_only:
+                baked_textures[group_index].colorspace_settings.name = 'sRGB' if pack.srgb else 'Non-Color'
+
+            for (mat, value) in zip(pack.materials, pack.cells):
+                if value == None:
+                    continue
+
+                tree = mat.node_tree
+                root_node = fetch_search_roots(build_node_relations(mat), node_blacklist)[0].node
+
+                # Cells are sampled at their centre; nearest sampling keeps neighbouring cells from bleeding in.
+                image_node = tree.nodes.new('ShaderNodeTexImage')
+                image_node.image = baked_textures[group_index]
+                image_node.interpolation = pack.interpolation
+                image_node.location = (root_node.location[0] - 300, root_node.location[1])
+
+                tree.links.new(image_node.outputs['Color'], root_node.inputs[pack.socket])
@@ -0,0 +1,70 @@
+from .shader_graph import node_tree_signature
+import numpy as np
+import bpy
+
+def canonical_materials(target_objs: list[bpy.types.Object]) -> dict[bpy.types.Material, bpy.types.Material]:
+    """Maps each material across the given objects to the first-encountered material sharing its node tree signature."""
+
+    canonical = {}
+    res = {}
+
+    for obj in target_objs:
+        for slot in obj.material_slots:
+            mat = slot.material
+            if mat in res:
+                continue
+
+            signature = node_tree_signature(mat)
+            res[mat] = mat if signature == None else canonical.setdefault(signature, mat)
+
+    return res
+
+def merge_materials(target_objs: list[bpy.types.Object]) -> int:
+    """Collapses identically-shaded materials into one across the given objects, remapping polygon material indices
+    and removing emptied slots. Returns the number of slots removed. (Destructive)
+    """
+
+    merged = canonical_materials(target_objs)
+    processed_meshes = set()
+    removed = 0
+
+    for obj in target_objs:
+        mesh: bpy.types.Mesh = obj.data
+        slot_count = len(obj.material_slots)
+
+        # Object-linked slots can't be reconciled with the mesh's own; shared meshes need only be processed once.
+        if mesh in processed_meshes or slot_count == 0 or any(slot.link == 'OBJECT' for slot in obj.material_slots):
+            continue
+
+        processed_meshes.add(mesh)
+
+        material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('material_index', material_indices)
+        material_indices = np.clip(material_indices, 0, slot_count - 1)
+
+        # Slots are compacted in order of first use, skipping those no polygon references.
+        used_slots = np.unique(material_indices)
+        compact_materials = []
+        remap = np.zeros(slot_count, dtype=np.int32)
+
+        for slot_index in used_slots:
+            mat = merged.get(obj.material_slots[slot_index].material, obj.material_slots[slot_index].material)
+
+            if not mat in compact_materials:
+                compact_materials.append(mat)
+
+            remap[slot_index] = compact_materials.index(mat)
+
+        for i, mat in enumerate(compact_materials):
+            mesh.materials[i] = mat
+
+        mesh.polygons.foreach_set('material_index', remap[material_indices])
+
+        # As all remaining polygons reference the leading slots, popping from the end leaves their indices untouched.
+        while len(mesh.materials) > max(len(compact_materials), 1):
+            mesh.materials.pop(index=len(mesh.materials) - 1)
+            removed += 1
+
+        mesh.update()
+
+    return removed
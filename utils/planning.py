@@ -0,0 +1,231 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from .image_retrieval import ImagePackData, UVReference
+from .image_packing import UVRectangle, calculate_uv_ratios, calculate_group_scales, channel_layout, layout_uvs
+from .dds_encoding import BLOCK_SIZES, encode_working_set
+from ..exceptions import PackingException
+
+import colorsys
+import math
+import time
+import numpy as np
+import bpy
+
+## Rough single-threaded throughputs, in pixels per second, used to estimate bake durations.
+DECODE_RATE = 40e6
+RESIZE_RATE = 25e6
+ENCODE_RATES = {
+    'PNG': 15e6,
+    'BC1': 4e6,
+    'BC3': 3e6,
+    'BC7': 2e6
+}
+
+PREVIEW_NAME = "FastPack Layout Preview"
+
+@dataclass
+class GroupPlan:
+    """Predicted outcome of baking a single atlas group.
+
+    Attributes:
+        group (int): The target group id.
+        resolution (int): Edge length of the group's full-resolution atlas, in pixels.
+        channels (int): Upper bound on the atlas' channel count, from its images' metadata.
+        fill_ratio (float): Portion of the atlas covered by the group's UV rectangles.
+        memory (int): Predicted bytes held while compositing the group.
+        seconds (float): Estimated time to resize, composite and save the group.
+        palette_only (bool): Whether the group holds palette grids alone within a textured selection; such atlases span
+            the full layout, yet only their grids' rectangles are filled.
+    """
+
+    group: int
+    resolution: int
+    channels: int
+    fill_ratio: float
+    memory: int
+    seconds: float
+    palette_only: bool = False
+
+@dataclass
+class BakePlan:
+    """Predicted outcome of a bake, computed from image and UV metadata alone.
+
+    Attributes:
+        success (bool): Whether the bake is expected to pack.
+        message (str): A human-readable summary, or the reason the bake would fail.
+        groups ([GroupPlan]): Per-group predictions.
+        rects ([UVRectangle]): The predicted normalized layout; identical to that the bake would produce.
+        peak_memory (int): Predicted peak bytes held over the bake.
+        seconds (float): Estimated time for the whole bake.
+    """
+
+    success: bool
+    message: str
+    groups: list[GroupPlan] = field(default_factory=list)
+    rects: list[UVRectangle] = field(default_factory=list)
+    peak_memory: int = 0
+    seconds: float = 0.0
+
+def decoded_bytes(pack: ImagePackData, scale: float = 1.0) -> int:
+    """Predicts the bytes an image occupies once decoded at its native precision and, optionally, rescaled."""
+
+    (w, h) = pack.size
+    return int(w * scale) * int(h * scale) * pack.channels * pack.dtype.itemsize
+
+def decode_transient_bytes(pack: ImagePackData) -> int:
+    """Predicts the bytes briefly held while decoding an image: Blender's float32 pixel buffer, and a float copy made
+    in trimming, re-encoding or quantizing it.
+    """
+
+    (w, h) = pack.size
+    return 2 * w * h * pack.channels * 4
+
+def resize_transient_bytes(pack: ImagePackData, scale: float) -> int:
+    """Predicts the bytes briefly held while resizing an image. Beyond 8 bits, each channel is resampled as a float32
+    image and the results stacked; 8-bit data is copied into and out of PIL at its own precision.
+    """
+
+    (w, h) = pack.size
+    (scaled_w, scaled_h) = (int(w * scale), int(h * scale))
+
+    if pack.dtype == np.uint8:
+        return (w * h + scaled_w * scaled_h) * pack.channels
+
+    return (w * h + 2 * scaled_w * scaled_h * pack.channels) * 4
+
+def encode_bytes(resolution: int, output_format: str, generate_mips: bool) -> int:
+    """Predicts the bytes briefly held while saving an atlas as DDS: its RGBA8 copy, any further mip levels alongside
+    the float copy filtering them requires, the encoders' working set, and the compressed data as it is joined.
+    """
+
+    if output_format == 'PNG':
+        return 0
+
+    rgba_bytes = resolution**2 * 4
+    res = rgba_bytes + encode_working_set(resolution)
+    compressed_bytes = resolution**2 * BLOCK_SIZES[output_format] // 16
+
+    if generate_mips:
+        # Halving the first level holds its float copy alongside that of the once-halved intermediate.
+        res += rgba_bytes // 3 + rgba_bytes * 6
+        compressed_bytes = compressed_bytes * 4 // 3
+
+    return res + 2 * compressed_bytes
+
+def plan_bake(image_packs: dict[bpy.types.Image, ImagePackData], group_images: defaultdict[int, list[ImagePackData]], uvs: list[list[UVReference]],
+    max_res: int, output_format: str = 'PNG', generate_mips: bool = False, lod_count: int = 1) -> BakePlan:
+    """Predicts atlas layouts, dimensions, memory use and durations without decoding any image data."""
+
+    (uv_reference_surface_areas, uv_widths_normalized, uv_heights_normalized) = calculate_uv_ratios(image_packs, uvs, max_res)
+    if sum(uv_reference_surface_areas) > max_res**2:
+        return BakePlan(False, f'Images cover {sum(uv_reference_surface_areas) / max_res**2:.0%} of a {max_res}px atlas')
+
+    layout_start = time.perf_counter()
+    try:
+        rects = layout_uvs(uv_widths_normalized, uv_heights_normalized)
+    except PackingException:
+        return BakePlan(False, f'UV rectangles could not be packed into a {max_res}px atlas')
+
+    seconds = time.perf_counter() - layout_start
+    rects_by_uv = {rect.uv_index : rect for rect in rects}
+    group_scales = calculate_group_scales(group_images, uv_reference_surface_areas)
+
+    # All images are decoded before any group is composited; their sum forms our memory baseline, atop which the
+    # largest of the buffers briefly held while decoding or resizing any one image is added.
+    # Packs sharing a source are decoded once.
+    sources = list({pack.source : pack for pack in image_packs.values()}.values())
+    source_memory = sum(decoded_bytes(pack) for pack in sources)
+    transient_memory = max((decode_transient_bytes(pack) for pack in sources), default=0)
+    seconds += sum(pack.size[0] * pack.size[1] for pack in sources) / DECODE_RATE
+
+    # Each level of a mip or LOD chain is a quarter the last; the chain hence sums to a third more than its head.
+    chain_factor = 4 / 3 if generate_mips or lod_count > 1 else 1.0
+    encode_rate = ENCODE_RATES.get(output_format, ENCODE_RATES['PNG'])
+
+    textured = any(pack.cells == None for pack in image_packs.values())
+
+    groups = []
+    for i, group in sorted(group_images.items()):
+        scale = group_scales[i]
+        resolution = math.floor(max_res * scale)
+
+        (has_color, has_alpha) = (False, False)
+        dtype = np.dtype(np.uint8)
+        for pack in group:
+            (color, alpha) = channel_layout(pack.channels)
+            has_color = has_color or color
+            has_alpha = has_alpha or alpha
+            dtype = np.promote_types(dtype, pack.dtype)
+
+        channels = (3 if has_color else 1) + (1 if has_alpha else 0)
+        canvas_memory = resolution**2 * channels * dtype.itemsize
+
+        # Filtering further levels requires a float copy of the canvas.
+        if chain_factor > 1.0:
+            canvas_memory += resolution**2 * channels * 4
+
+        resized_memory = 0
+        resized_pixels = 0
+        for pack in group:
+            (w, h) = pack.size
+            scale_factor = scale / ((w * h) / uv_reference_surface_areas[pack.uv_index])**0.5
+            resized_memory += decoded_bytes(pack, scale_factor)
+            resized_pixels += int(w * scale_factor) * int(h * scale_factor)
+
+            if scale_factor != 1.0:
+                transient_memory = max(transient_memory, resize_transient_bytes(pack, scale_factor))
+
+        # Each level is saved in turn; the first, being the largest, bounds the memory saving any one of them holds.
+        canvas_memory += encode_bytes(resolution, output_format, generate_mips)
+
+        uv_indices = {pack.uv_index for pack in group}
+        fill_ratio = sum(rects_by_uv[uv].width * rects_by_uv[uv].height for uv in uv_indices)
+        group_seconds = resized_pixels / RESIZE_RATE + resolution**2 * max(lod_count, 1) * chain_factor / encode_rate
+
+        # Untextured selections are laid out against their palette grids alone, and so incur no such cost.
+        palette_only = textured and all(pack.cells != None for pack in group)
+        groups.append(GroupPlan(i, resolution, channels, fill_ratio, resized_memory + canvas_memory, group_seconds, palette_only))
+        seconds += group_seconds
+
+    peak_memory = source_memory + max((group.memory for group in groups), default=0) + transient_memory
+    message = f'{len(groups)} atlas(es), ~{peak_memory / 2**20:.0f} MiB peak, ~{seconds:.1f}s'
+
+    # Mip chains run down to a single texel; palette cells inevitably blend with their neighbours towards its end.
+    cell_sizes = [pack.cell_size >> (max(lod_count, 1) - 1) for pack in image_packs.values() if pack.cells != None]
+    if generate_mips and output_format != 'PNG' and len(cell_sizes) > 0:
+        message += f'; palette cells blend beyond mip {max(int(math.log2(min(cell_sizes))) - 1, 0)}'
+
+    return BakePlan(True, message, groups, rects, peak_memory, seconds)
+
+def update_layout_preview(plan: BakePlan, size: int = 128) -> bpy.types.Image:
+    """Draws a plan's normalized layout into a small Blender image, such that it may be displayed within the UI."""
+
+    canvas = np.zeros((size, size, 4), dtype=np.float32)
+    canvas[:, :, 3] = 1.0
+
+    for rect in plan.rects:
+        if rect.x == None:
+            continue
+
+        # Successive sub-UVs are spaced around the hue wheel by the golden ratio, keeping neighbours distinct.
+        color = colorsys.hsv_to_rgb((rect.uv_index * 0.618034) % 1.0, 0.6, 0.9)
+        (x0, y0) = (math.floor(rect.x * size), math.floor(rect.y * size))
+        (x1, y1) = (max(math.ceil((rect.x + rect.width) * size), x0 + 1), max(math.ceil((rect.y + rect.height) * size), y0 + 1))
+
+        # Blender's pixel rows run bottom-up, matching UV space.
+        canvas[y0:y1, x0:x1, 0:3] = color
+        canvas[y0:y1, x0:x0 + 1, 0:3] = 1.0
+        canvas[y0:y0 + 1, x0:x1, 0:3] = 1.0
+
+    preview = bpy.data.images.get(PREVIEW_NAME)
+    if preview == None or tuple(preview.size) != (size, size):
+        if preview != None:
+            bpy.data.images.remove(preview)
+
+        preview = bpy.data.images.new(PREVIEW_NAME, size, size, alpha=True)
+
+    preview.pixels.foreach_set(canvas.ravel())
+    preview.update()
+    preview.preview_ensure().reload()
+
+    return preview
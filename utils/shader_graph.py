@@ -136,4 +136,193 @@ def grab_socket_images(mesh: bpy.types.Mesh, g_node: GraphNode, socket: str) ->
                 for node in cur_socket:
                     node_stack.append(node)
     
-    return res
\ No newline at end of file
+    return res
+
+## Nodes whose output is a single, user-set constant.
+CONSTANT_NODES = {'ShaderNodeRGB', 'ShaderNodeValue'}
+
+## Luminance weights Blender applies when implicitly converting colors to floats.
+LUMINANCE_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+def grab_socket_constant(g_node: GraphNode, socket: bpy.types.NodeSocket) -> tuple[float, ...]:
+    """Resolves the constant driving a color or float input socket of a graph node, given either its default
+    value or a directly-linked constant node; returns None should the input vary, or be of any other type.
+    Colors resolve to RGBA tuples, and floats to single-element tuples.
+    """
+
+    if not socket.type in {'RGBA', 'VALUE'}:
+        return None
+
+    if socket.name in g_node.n_to:
+        src_node = g_node.first_to_link(socket.name).node
+
+        if not src_node.bl_idname in CONSTANT_NODES:
+            return None
+
+        value = src_node.outputs[0].default_value
+    else:
+        value = socket.default_value
+
+    if isinstance(value, float):
+        return (value, value, value, 1.0) if socket.type == 'RGBA' else (value,)
+
+    value = tuple(value)
+    if socket.type == 'VALUE':
+        return (sum(c * w for c, w in zip(value, LUMINANCE_WEIGHTS)),)
+
+    return value
+
+def material_constants(root_nodes: list[GraphNode]) -> Dict[str, tuple[float, ...]]:
+    """Given a material's search roots, returns the constant value of each color and float input of its sole
+    shader; or None should it possess several shaders, or any input driven by something other than a constant.
+    """
+
+    if len(root_nodes) != 1:
+        return None
+
+    g_node = root_nodes[0]
+    res = {}
+
+    for socket in g_node.node.inputs:
+        if not socket.enabled:
+            continue
+
+        value = grab_socket_constant(g_node, socket)
+        if value == None:
+            if socket.name in g_node.n_to:
+                return None
+
+            continue
+
+        res[socket.name] = value
+
+    return res
+
+def socket_value_signature(socket: bpy.types.NodeSocket):
+    """Fetches a hashable representation of an unlinked socket's value."""
+
+    if not hasattr(socket, 'default_value'):
+        return None
+
+    value = socket.default_value
+
+    if isinstance(value, float):
+        return round(value, 6)
+
+    if isinstance(value, (int, str, bool)) or value is None:
+        return value
+
+    return tuple(round(v, 6) for v in value)
+
+## Properties describing editor state alone, rather than shading.
+IGNORED_PROPERTIES = {'rna_type', 'select'}
+
+## Nesting beyond which owned data (e.g. ramp elements or curve points) is assumed unrecognized, and left unmerged.
+MAX_STRUCT_DEPTH = 4
+
+def property_signature(owner: bpy.types.bpy_struct, prop: bpy.types.Property, depth: int):
+    """Fetches a hashable representation of a property's value, descending into the data it owns (e.g. a node's ColorRamp
+    or CurveMapping); or None, should that data be nested too deeply to be described.
+    """
+
+    value = getattr(owner, prop.identifier)
+
+    if prop.type == 'POINTER':
+        if value is None:
+            return ()
+
+        return value if isinstance(value, bpy.types.ID) else struct_signature(value, depth + 1)
+
+    if prop.type == 'COLLECTION':
+        items = tuple(struct_signature(item, depth + 1) for item in value)
+        return None if None in items else items
+
+    if prop.type in {'FLOAT', 'INT', 'BOOLEAN'} and getattr(prop, 'array_length', 0) > 0:
+        return tuple(value)
+
+    if isinstance(value, set):
+        return frozenset(value)
+
+    return value
+
+def struct_signature(struct: bpy.types.bpy_struct, depth: int) -> tuple:
+    """Builds a hashable description of every property of a node-owned struct; or None, should it be nested too deeply."""
+
+    if depth > MAX_STRUCT_DEPTH:
+        return None
+
+    properties = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in IGNORED_PROPERTIES:
+            continue
+
+        value = property_signature(struct, prop, depth)
+        if value == None:
+            return None
+
+        properties.append((prop.identifier, value))
+
+    return (struct.bl_rna.identifier, tuple(properties))
+
+def node_signature(node: bpy.types.Node, links: Dict[tuple[str, str], bpy.types.NodeLink], base_properties: set[str], memo: Dict[str, tuple]) -> tuple:
+    """Recursively builds a hashable description of a node and everything upstream of it, independent of node names and layout;
+    or None, should any of their data be left undescribed.
+    """
+
+    if node.name in memo:
+        return memo[node.name]
+
+    properties = []
+    for prop in node.bl_rna.properties:
+        if prop.identifier in base_properties or prop.identifier in IGNORED_PROPERTIES:
+            continue
+
+        # Read-only pointers and collections (e.g. color ramps, curve mappings and image users) hold settings of their own.
+        if prop.is_readonly and prop.type not in {'POINTER', 'COLLECTION'}:
+            continue
+
+        value = property_signature(node, prop, 0)
+        if value == None and prop.type in {'POINTER', 'COLLECTION'}:
+            memo[node.name] = None
+            return None
+
+        properties.append((prop.identifier, value))
+
+    inputs = []
+    for socket in node.inputs:
+        link = links.get((node.name, socket.identifier))
+
+        if link == None:
+            inputs.append((socket.identifier, socket_value_signature(socket)))
+            continue
+
+        upstream = node_signature(link.from_node, links, base_properties, memo)
+        if upstream == None:
+            memo[node.name] = None
+            return None
+
+        inputs.append((socket.identifier, link.from_socket.identifier, upstream))
+
+    memo[node.name] = (node.bl_idname, node.mute, tuple(properties), tuple(inputs))
+    return memo[node.name]
+
+def node_tree_signature(mat: bpy.types.Material) -> tuple:
+    """Returns a hashable description of a material's shading, equal between materials which would render identically;
+    or None, should the material lack a node-based output.
+    """
+
+    if mat == None or not mat.use_nodes:
+        return None
+
+    outputs = [node for node in mat.node_tree.nodes if node.bl_idname == 'ShaderNodeOutputMaterial' and node.is_active_output]
+    if len(outputs) == 0:
+        return None
+
+    links = {(link.to_node.name, link.to_socket.identifier) : link for link in mat.node_tree.links if link.is_valid and not link.is_muted}
+    base_properties = {prop.identifier for prop in bpy.types.ShaderNode.bl_rna.properties}
+
+    signature = node_signature(outputs[0], links, base_properties, {})
+    if signature == None:
+        return None
+
+    return (mat.blend_method, mat.shadow_method, mat.use_backface_culling, signature)